@@ -1,145 +1,375 @@
+import argparse
+import asyncio
+import functools
+import logging
+import math
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 import os
-import json
+import time
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
-import time
-from translations import get_text, format_time
+from translations import available_languages, catalog_path, get_text, format_time, reload_translations, translator_for
+from config_store import settings
+from cooldowns import ShardedCooldowns, cooldown_key
+from members import FANOUT_CONCURRENCY, TargetResolver
+from sharding import ShardPartitioned, parse_shard_ids
+from delivery import DeliveryJob, DeliveryQueue, DigestBatcher
+from embeds import EmbedTemplates
+from coordinator import CoordinatorBackend, CoordinatorClient
+from command_sync import sync_if_changed
+from logs import setup_logging
+from history import HISTORY_DIR, OUTCOMES, PingHistory
+from watcher import FileWatcher
+from metrics import COOLDOWN_REJECTIONS, STAGE_LATENCY, Gauge, instrument_http, start_server, track_command
 
 # Load environment variables
 load_dotenv()
 
+log = logging.getLogger('glouglou')
+
+# Lean mode: only the intents the bot uses, and only target members cached
+LEAN_INTENTS = os.getenv('LEAN_INTENTS', '').lower() in ('1', 'true', 'yes')
+
 # Bot configuration
-intents = discord.Intents.default()
-intents.message_content = True
-intents.guilds = True
-intents.presences = True
-intents.members = True
+if LEAN_INTENTS:
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.presences = True  # DND check on the target
+    intents.members = True    # Required to request members over the gateway
+    bot_options = {
+        'member_cache_flags': discord.MemberCacheFlags.none(),
+        'chunk_guilds_at_startup': False,
+        'max_messages': None,
+    }
+else:
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.guilds = True
+    intents.presences = True
+    intents.members = True
+    bot_options = {}
+
+# Sharded mode (AutoShardedBot): SHARDED=1, with optional SHARD_COUNT and SHARD_IDS ("0-3,8")
+SHARD_COUNT = int(os.getenv('SHARD_COUNT')) if os.getenv('SHARD_COUNT') else None
+SHARD_IDS = parse_shard_ids(os.getenv('SHARD_IDS'))
+SHARDED = os.getenv('SHARDED', '').lower() in ('1', 'true', 'yes') or SHARD_COUNT is not None
+
+if SHARDED:
+    bot_options['shard_count'] = SHARD_COUNT
+    if SHARD_IDS is not None:
+        bot_options['shard_ids'] = SHARD_IDS
+
+# Slash command sync: auto (only when the command tree changed), force (--force-sync) or off
+COMMAND_SYNC = os.getenv('COMMAND_SYNC', 'auto').lower()
+
+class BotHooks:
+    """Startup and shutdown hooks for the background services"""
+
+    # Set once the first connection has been announced by this process
+    connected_once = False
+
+    async def setup_hook(self):
+        global coordinator
+        if COORDINATOR_ADDRESS:
+            # Cluster worker: cooldowns, configuration and the DM budget are shared
+            # Changes pushed by the coordinator before the configuration is loaded are merged by warm()
+            coordinator = CoordinatorClient(COORDINATOR_ADDRESS, on_config_change=settings.apply)
+            settings.use(CoordinatorBackend(coordinator))
+            await coordinator.connect()
+            deliveries.throttle = coordinator.dm_throttle
+        # Load the server configuration (and the known DM channels) off the event loop, before
+        # the gateway connects: lookups are only served from memory and fail until it is loaded
+        await asyncio.to_thread(settings.warm)
+        if coordinator is None:
+            await asyncio.to_thread(cooldowns.load)
+            save_cooldowns.start()
+        await asyncio.to_thread(history.open)
+        # Apply edits to config.json and the translation catalog without restarting
+        self.file_watcher = await asyncio.to_thread(start_file_watcher)
+        deliveries.start()
+        # Sync the slash commands in the background, once per process
+        if COMMAND_SYNC != 'off':
+            self.sync_task = asyncio.create_task(sync_commands(force=COMMAND_SYNC == 'force'))
+        # Count REST calls, and expose metrics if METRICS_PORT is set
+        instrument_http(self.http)
+        if os.getenv('METRICS_PORT'):
+            self.metrics_server = await start_server(
+                int(os.getenv('METRICS_PORT')), os.getenv('METRICS_HOST', '127.0.0.1')
+            )
+
+    async def close(self):
+        if getattr(self, 'metrics_server', None) is not None:
+            self.metrics_server.close()
+        if getattr(self, 'file_watcher', None) is not None:
+            await asyncio.to_thread(self.file_watcher.stop)
+        await deliveries.stop()
+        await super().close()
+        if coordinator is None:
+            save_cooldowns.cancel()
+            await asyncio.to_thread(cooldowns.save)
+        # Write pending configuration changes and ping history before exiting
+        await asyncio.to_thread(settings.close)
+        await asyncio.to_thread(history.close)
+        if coordinator is not None:
+            await coordinator.close()
 
-bot = commands.Bot(command_prefix='!', intents=intents)
+class GlouGlouBot(BotHooks, commands.Bot):
+    """Bot running on a single gateway connection"""
 
-# Configuration file to store targets per server
-CONFIG_FILE = 'config.json'
+class ShardedGlouGlouBot(BotHooks, commands.AutoShardedBot):
+    """Bot running one gateway connection per shard"""
 
-# Dictionary to store last command usage per server
-# Format: {guild_id: timestamp}
-last_usage = {}
+bot_class = ShardedGlouGlouBot if SHARDED else GlouGlouBot
+bot = bot_class(command_prefix='!', intents=intents, **bot_options)
+
+# Running cooldowns per server, snapshotted to disk every COOLDOWN_SAVE_INTERVAL seconds
+# (partitioned per shard, like the member caches)
+cooldowns = ShardedCooldowns(SHARD_COUNT)
+COOLDOWN_SAVE_INTERVAL = 30
+
+# Cluster mode (see cluster.py): address of the coordinator holding the shared state
+COORDINATOR_ADDRESS = os.getenv('COORDINATOR_ADDRESS')
+coordinator = None
+
+# Target members resolved per server (gateway cache first, REST on a miss),
+# at most FANOUT_CONCURRENCY fetched at the same time on a ping
+fanout_concurrency = int(os.getenv('FANOUT_CONCURRENCY', FANOUT_CONCURRENCY))
+targets = ShardPartitioned(lambda: TargetResolver(lean=LEAN_INTENTS, concurrency=fanout_concurrency), SHARD_COUNT)
+
+# Outcome of every ping, with running per-server statistics for /pingstats
+history = PingHistory(os.getenv('HISTORY_DIR', HISTORY_DIR))
+
+# Ping embed prebuilt per server (language and server name), patched on every ping
+notification_embeds = EmbedTemplates()
+
+# Maximum number of recipients per server
+MAX_TARGETS = 10
+
+# Private messages are sent by background workers after the interaction is answered
+deliveries = DeliveryQueue(workers=int(os.getenv('DM_WORKERS', '4')))
+Gauge('glouglou_dm_queue_depth', 'Private messages waiting to be sent', callback=lambda: len(deliveries))
+Gauge('glouglou_cooldowns_active', 'Running cooldowns (servers, members and channels)', callback=lambda: len(cooldowns))
+
+def shard_stats():
+    """Latency (in seconds) and number of servers of every shard"""
+    guild_counts = {}
+    for guild in bot.guilds:
+        guild_counts[guild.shard_id] = guild_counts.get(guild.shard_id, 0) + 1
+    if SHARDED:
+        latencies = dict(bot.latencies)
+    else:
+        latencies = {0: bot.latency}
+    return {
+        shard_id: (latency, guild_counts.get(shard_id, 0))
+        for shard_id, latency in latencies.items()
+    }
+
+Gauge('glouglou_shard_latency_seconds', 'Gateway latency per shard', ['shard'],
+      callback=lambda: {(str(k),): v[0] for k, v in shard_stats().items() if not math.isnan(v[0])})
+Gauge('glouglou_shard_guilds', 'Servers per shard', ['shard'],
+      callback=lambda: {(str(k),): v[1] for k, v in shard_stats().items()})
+
+def apply_translations(path=None):
+    """Load the external translation catalog, keeping the current one if it is invalid"""
+    try:
+        changed = reload_translations(path)
+    except (OSError, ValueError) as e:
+        log.error('Translation catalog rejected', extra={'error': str(e)})
+        return
+    if changed:
+        log.info('Translations reloaded', extra={'strings': len(changed)})
+
+def start_file_watcher():
+    """Watch the configuration file (JSON backend) and the translation catalog"""
+    apply_translations()
+    watcher = FileWatcher()
+    watcher.watch(catalog_path(), apply_translations)
+    # In cluster mode the coordinator watches the configuration
+    if coordinator is None:
+        settings.watch(watcher)
+    watcher.start()
+    return watcher
 
 def load_config():
-    """Load configuration from JSON file"""
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+    """Load configuration (served from the in-memory settings store)"""
+    return settings.load()
 
 def save_config(config):
     """Save configuration to JSON file"""
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(config, f, indent=2)
-
-def get_target_user(guild_id):
-    """Get the target user ID for a server"""
-    config = load_config()
-    guild_config = config.get(str(guild_id))
-    if isinstance(guild_config, dict):
-        return guild_config.get('target_user')
-    return guild_config  # Old format (backward compatibility)
-
-def set_target_user(guild_id, user_id):
-    """Set the target user for a server"""
-    config = load_config()
-    if str(guild_id) not in config:
-        config[str(guild_id)] = {}
-    config[str(guild_id)]['target_user'] = user_id
-    save_config(config)
-
-def get_cooldown(guild_id):
-    """Get the configured cooldown for a server (in seconds)"""
-    config = load_config()
-    guild_config = config.get(str(guild_id))
-    if isinstance(guild_config, dict):
-        return guild_config.get('cooldown', 60)  # 60 seconds by default
-    return 60  # 60 seconds by default
-
-def set_cooldown(guild_id, cooldown_seconds):
-    """Set the cooldown for a server (in seconds)"""
-    config = load_config()
-    if str(guild_id) not in config:
-        config[str(guild_id)] = {}
-    elif not isinstance(config[str(guild_id)], dict):
-        # Migration: convert old format (just ID) to new format
-        old_target = config[str(guild_id)]
-        config[str(guild_id)] = {'target_user': old_target}
-    
-    config[str(guild_id)]['cooldown'] = cooldown_seconds
-    save_config(config)
+    settings.save(config)
+
+def get_target_users(guild_id):
+    """Get the target user IDs for a server"""
+    return list(settings.get(guild_id, 'target_users', []))
+
+def set_target_users(guild_id, user_ids):
+    """Set the target users for a server"""
+    settings.set(guild_id, 'target_users', list(user_ids))
+    # Forget the private channels of users who are no longer targets
+    channels = settings.get(guild_id, 'dm_channels')
+    if channels:
+        kept = {user_id: channel_id for user_id, channel_id in channels.items() if int(user_id) in user_ids}
+        if len(kept) != len(channels):
+            settings.set(guild_id, 'dm_channels', kept)
+
+def get_dm_channel(guild_id, user_id):
+    """Get the known private channel of a target user (messages are posted to it directly), or None"""
+    channel_id = settings.get(guild_id, 'dm_channels', {}).get(str(user_id))
+    if channel_id is None:
+        return None
+    return bot.get_partial_messageable(channel_id, type=discord.ChannelType.private)
+
+def set_dm_channel(guild_id, user_id, channel_id):
+    """Remember the private channel opened for a target user"""
+    channels = settings.get(guild_id, 'dm_channels', {})
+    if channels.get(str(user_id)) != channel_id:
+        settings.set(guild_id, 'dm_channels', {**channels, str(user_id): channel_id})
+
+# Cooldown scopes and the setting holding each one (user and channel scopes are off by default)
+COOLDOWN_SETTINGS = {'guild': 'cooldown', 'user': 'user_cooldown', 'channel': 'channel_cooldown'}
+
+def get_cooldown(guild_id, scope='guild'):
+    """Get the configured cooldown for a server, per member or per channel (in seconds, 0 = off)"""
+    return settings.get(guild_id, COOLDOWN_SETTINGS[scope], 60 if scope == 'guild' else 0)  # 60 seconds by default
+
+def set_cooldown(guild_id, cooldown_seconds, scope='guild'):
+    """Set the cooldown for a server, per member or per channel (in seconds)"""
+    settings.set(guild_id, COOLDOWN_SETTINGS[scope], cooldown_seconds)
 
 def get_language(guild_id):
     """Get the configured language for a server"""
-    config = load_config()
-    guild_config = config.get(str(guild_id))
-    if isinstance(guild_config, dict):
-        return guild_config.get('language', 'en')  # English by default
-    return 'en'  # English by default
+    return settings.get(guild_id, 'language', 'en')  # English by default
 
 def set_language(guild_id, language):
     """Set the language for a server"""
-    config = load_config()
-    if str(guild_id) not in config:
-        config[str(guild_id)] = {}
-    elif not isinstance(config[str(guild_id)], dict):
-        # Migration: convert old format (just ID) to new format
-        old_target = config[str(guild_id)]
-        config[str(guild_id)] = {'target_user': old_target}
-    
-    config[str(guild_id)]['language'] = language
-    save_config(config)
-
-def check_cooldown(guild_id):
+    settings.set(guild_id, 'language', language)
+
+def cooldown_claims(guild_id, user_id=None, channel_id=None):
+    """(scope, key, seconds) of every cooldown enabled for a server"""
+    claims = []
+    for scope, scope_id in (('guild', None), ('user', user_id), ('channel', channel_id)):
+        seconds = get_cooldown(guild_id, scope)
+        if seconds > 0 and (scope == 'guild' or scope_id is not None):
+            claims.append((scope, cooldown_key(guild_id, scope, scope_id), seconds))
+    return claims
+
+async def claim_cooldown(guild_id, user_id=None, channel_id=None):
     """
-    Check if the command can be used on the server
-    Returns (can_use: bool, remaining_time: int)
+    Atomically check the server, member and channel cooldowns and start them if the command can be used
+    Returns (can_use: bool, remaining_time: int, blocking scope or None)
     """
-    cooldown_seconds = get_cooldown(guild_id)
-    
-    if guild_id not in last_usage:
-        return True, 0
-    
-    last_time = last_usage[guild_id]
-    elapsed = time.time() - last_time
-    
-    if elapsed >= cooldown_seconds:
-        return True, 0
-    
-    remaining = int(cooldown_seconds - elapsed)
-    return False, remaining
+    claims = cooldown_claims(guild_id, user_id, channel_id)
+    if not claims:
+        return True, 0, None
+    pairs = [(key, seconds) for _, key, seconds in claims]
+    if coordinator is not None:
+        can_use, remaining, blocking = await coordinator.try_claim_many(pairs)
+    else:
+        can_use, remaining, blocking = cooldowns.try_claim_many(pairs)
+    return can_use, remaining, None if blocking is None else claims[blocking][0]
+
+async def release_cooldown(guild_id, user_id=None, channel_id=None):
+    """Cancel the cooldowns claimed for a ping (notification not delivered)"""
+    keys = [cooldown_key(guild_id)]
+    if user_id is not None:
+        keys.append(cooldown_key(guild_id, 'user', user_id))
+    if channel_id is not None:
+        keys.append(cooldown_key(guild_id, 'channel', channel_id))
+    if coordinator is not None:
+        await coordinator.release_many(keys)
+    else:
+        cooldowns.release_many(keys)
 
-def set_last_usage(guild_id):
-    """Record the timestamp of the last usage for the server"""
-    last_usage[guild_id] = time.time()
+@tasks.loop(seconds=COOLDOWN_SAVE_INTERVAL)
+async def save_cooldowns():
+    """Periodically snapshot running cooldowns so they survive restarts"""
+    await asyncio.to_thread(cooldowns.save)
 
 @bot.event
 async def on_ready():
-    """Event triggered when the bot is ready"""
-    print(get_text(0, 'bot_connected', name=bot.user.name, id=bot.user.id))
-    print('------')
+    """
+    Event triggered when the bot is ready
+    With sharding, fires once every shard has connected; without, after every new gateway session
+    """
+    # Auto-sharding only knows the shard count once connected
+    cooldowns.resize(bot.shard_count)
+    targets.resize(bot.shard_count)
+    
+    if bot.connected_once:
+        return
+    bot.connected_once = True
     
+    log.info('Bot connected', extra={'user': bot.user.name, 'user_id': bot.user.id})
+
+async def sync_commands(force=False):
+    """Sync the slash commands if they changed since the last sync (or if forced)"""
     try:
-        # Sync slash commands
-        synced = await bot.tree.sync()
-        print(get_text(0, 'commands_synced', count=len(synced)))
+        synced = await sync_if_changed(bot.tree, bot.application_id, force=force)
+        if synced is None:
+            log.info('Slash commands unchanged, sync skipped')
+        else:
+            log.info('Slash commands synced', extra={'count': len(synced)})
     except Exception as e:
-        print(get_text(0, 'sync_error', error=e))
+        log.error('Slash command sync failed', extra={'error': str(e)})
+
+@bot.event
+async def on_shard_ready(shard_id):
+    """Event triggered when a shard has connected (first time or after a new session)"""
+    # Events may have been missed: drop the shard's cached members
+    targets.reset(shard_id)
+    latency, guild_count = shard_stats().get(shard_id, (float('nan'), 0))
+    log.info('Shard ready', extra={'shard_id': shard_id, 'guilds': guild_count, 'latency_ms': round(latency * 1000)})
+
+@bot.event
+async def on_guild_available(guild):
+    """In lean mode, request the configured targets so their presence is tracked"""
+    if LEAN_INTENTS:
+        target_user_ids = get_target_users(guild.id)
+        if target_user_ids:
+            # Paced per shard: a burst of servers at startup must not hold back the requests of pings
+            await targets.for_guild(guild.id).prefetch(guild, target_user_ids)
+
+@bot.event
+async def on_guild_update(before, after):
+    """Rebuild the ping embed of a renamed server"""
+    notification_embeds.invalidate(after.id)
+
+@bot.event
+async def on_member_update(before, after):
+    """Drop the cached copy of a member whose details changed"""
+    targets.for_guild(after.guild.id).invalidate(after.guild.id, after.id)
+
+@bot.event
+async def on_presence_update(before, after):
+    """Drop the cached copy of a member whose presence changed"""
+    targets.for_guild(after.guild.id).invalidate(after.guild.id, after.id)
+
+@bot.event
+async def on_member_join(member):
+    """Forget that a member who (re)joined the server was gone"""
+    targets.for_guild(member.guild.id).invalidate(member.guild.id, member.id)
+
+@bot.event
+async def on_member_remove(member):
+    """Drop the cached copy of a member who left the server"""
+    targets.for_guild(member.guild.id).invalidate(member.guild.id, member.id)
+
+@bot.event
+async def on_raw_member_remove(payload):
+    """Same as on_member_remove, for members that were not in the gateway cache"""
+    targets.for_guild(payload.guild_id).invalidate(payload.guild_id, payload.user.id)
 
 @bot.tree.command(name="settarget", description="Set the user who will receive notifications (Admin only)")
 @app_commands.describe(user="The user who will receive the pings")
 @app_commands.checks.has_permissions(administrator=True)
 @app_commands.guild_only()
+@track_command('settarget')
 async def settarget(interaction: discord.Interaction, user: discord.Member):
     """
     Command to set the target user who will receive notifications
+    Replaces every previously configured target
     Admin only
     """
     if interaction.guild is None:
@@ -147,53 +377,155 @@ async def settarget(interaction: discord.Interaction, user: discord.Member):
         return
 
     guild_id = interaction.guild.id
-    set_target_user(guild_id, user.id)
+    set_target_users(guild_id, [user.id])
     
     await interaction.response.send_message(
-        get_text(guild_id, 'target_set', user=user.name),
+        translator_for(guild_id)('target_set', user=user.name),
+        ephemeral=True
+    )
+    
+    if LEAN_INTENTS:
+        # Keep the new target (and its presence) in the member cache
+        await targets.for_guild(interaction.guild.id).warm(interaction.guild, [user.id])
+
+@bot.tree.command(name="addtarget", description="Add a user who will receive notifications (Admin only)")
+@app_commands.describe(user="The user who will also receive the pings")
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.guild_only()
+@track_command('addtarget')
+async def addtarget(interaction: discord.Interaction, user: discord.Member):
+    """
+    Command to add a target user to the list of recipients
+    Admin only
+    """
+    if interaction.guild is None:
+        await interaction.response.send_message("This command can only be used in a server.", ephemeral=True)
+        return
+
+    guild_id = interaction.guild.id
+    t = translator_for(guild_id)
+    target_user_ids = get_target_users(guild_id)
+    
+    if user.id in target_user_ids:
+        await interaction.response.send_message(
+            t('target_already_set', user=user.name),
+            ephemeral=True
+        )
+        return
+    
+    if len(target_user_ids) >= MAX_TARGETS:
+        await interaction.response.send_message(
+            t('targets_full', max=MAX_TARGETS),
+            ephemeral=True
+        )
+        return
+    
+    set_target_users(guild_id, target_user_ids + [user.id])
+    
+    await interaction.response.send_message(
+        t('target_added', user=user.name, count=len(target_user_ids) + 1),
+        ephemeral=True
+    )
+    
+    if LEAN_INTENTS:
+        # Keep the new target (and its presence) in the member cache
+        await targets.for_guild(interaction.guild.id).warm(interaction.guild, [user.id])
+
+@bot.tree.command(name="removetarget", description="Remove a user from the notification recipients (Admin only)")
+@app_commands.describe(user="The user who will no longer receive the pings")
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.guild_only()
+@track_command('removetarget')
+async def removetarget(interaction: discord.Interaction, user: discord.User):
+    """
+    Command to remove a target user from the list of recipients
+    Admin only
+    """
+    if interaction.guild is None:
+        await interaction.response.send_message("This command can only be used in a server.", ephemeral=True)
+        return
+
+    guild_id = interaction.guild.id
+    t = translator_for(guild_id)
+    target_user_ids = get_target_users(guild_id)
+    
+    if user.id not in target_user_ids:
+        await interaction.response.send_message(
+            t('target_not_in_list', user=user.name),
+            ephemeral=True
+        )
+        return
+    
+    target_user_ids.remove(user.id)
+    set_target_users(guild_id, target_user_ids)
+    
+    await interaction.response.send_message(
+        t('target_removed', user=user.name, count=len(target_user_ids)),
         ephemeral=True
     )
 
 @bot.tree.command(name="setcooldown", description="Set the cooldown for the /deepthroat command (Admin only)")
-@app_commands.describe(seconds="Cooldown duration in seconds (minimum: 1, maximum: 86400)")
+@app_commands.describe(
+    seconds="Cooldown in seconds (1 to 86400; 0 turns off the member or channel cooldown)",
+    scope="Whole server (default), each member, or each channel"
+)
+@app_commands.choices(scope=[
+    app_commands.Choice(name="server", value="guild"),
+    app_commands.Choice(name="member", value="user"),
+    app_commands.Choice(name="channel", value="channel"),
+])
 @app_commands.checks.has_permissions(administrator=True)
 @app_commands.guild_only()
-async def setcooldown(interaction: discord.Interaction, seconds: int):
+@track_command('setcooldown')
+async def setcooldown(interaction: discord.Interaction, seconds: int, scope: str = 'guild'):
     """
     Command to set the cooldown for the /deepthroat command
+    for the whole server, each member or each channel
     Admin only
     """
     if interaction.guild is None:
         await interaction.response.send_message("This command can only be used in a server.", ephemeral=True)
         return
 
+    t = translator_for(interaction.guild.id)
+
+    if scope != 'guild' and seconds == 0:
+        # Member and channel cooldowns are optional
+        set_cooldown(interaction.guild.id, 0, scope)
+        await interaction.response.send_message(
+            t(f'cooldown_{scope}_disabled'),
+            ephemeral=True
+        )
+        return
+    
     if seconds < 1:
         await interaction.response.send_message(
-            get_text(interaction.guild.id, 'cooldown_min_error'),
+            t('cooldown_min_error'),
             ephemeral=True
         )
         return
     
     if seconds > 86400:  # 24 hours max
         await interaction.response.send_message(
-            get_text(interaction.guild.id, 'cooldown_max_error'),
+            t('cooldown_max_error'),
             ephemeral=True
         )
         return
     
     guild_id = interaction.guild.id
-    set_cooldown(guild_id, seconds)
+    set_cooldown(guild_id, seconds, scope)
     
     # Format time in a readable way
-    time_str = format_time(seconds, guild_id)
+    time_str = format_time(seconds, t)
     
     await interaction.response.send_message(
-        get_text(guild_id, 'cooldown_set', time_str=time_str, seconds=seconds),
+        t('cooldown_set' if scope == 'guild' else f'cooldown_{scope}_set', time_str=time_str, seconds=seconds),
         ephemeral=True
     )
 
 @bot.tree.command(name="viewcooldown", description="Display the current cooldown for the /deepthroat command")
 @app_commands.guild_only()
+@track_command('viewcooldown')
 async def viewcooldown(interaction: discord.Interaction):
     """
     Command to display the current configured cooldown for the server
@@ -204,12 +536,20 @@ async def viewcooldown(interaction: discord.Interaction):
 
     guild_id = interaction.guild.id
     cooldown = get_cooldown(guild_id)
+    t = translator_for(guild_id)
     
     # Format time in a readable way
-    time_str = format_time(cooldown, guild_id)
+    time_str = format_time(cooldown, t)
+    lines = [t('cooldown_current', time_str=time_str, seconds=cooldown)]
+    
+    # Optional member and channel cooldowns
+    for scope in ('user', 'channel'):
+        seconds = get_cooldown(guild_id, scope)
+        if seconds > 0:
+            lines.append(t(f'cooldown_current_{scope}', time_str=format_time(seconds, t), seconds=seconds))
     
     await interaction.response.send_message(
-        get_text(guild_id, 'cooldown_current', time_str=time_str, seconds=cooldown),
+        "\n".join(lines),
         ephemeral=True
     )
 
@@ -217,6 +557,7 @@ async def viewcooldown(interaction: discord.Interaction):
 @app_commands.describe(language="Language (en for English, fr for French)")
 @app_commands.checks.has_permissions(administrator=True)
 @app_commands.guild_only()
+@track_command('setlanguage')
 async def setlanguage(interaction: discord.Interaction, language: str):
     """
     Command to set the bot language for the server
@@ -228,7 +569,7 @@ async def setlanguage(interaction: discord.Interaction, language: str):
 
     language = language.lower()
     
-    if language not in ['en', 'fr']:
+    if language not in available_languages():
         await interaction.response.send_message(
             get_text(interaction.guild.id, 'language_invalid'),
             ephemeral=True
@@ -237,111 +578,236 @@ async def setlanguage(interaction: discord.Interaction, language: str):
     
     guild_id = interaction.guild.id
     set_language(guild_id, language)
+    notification_embeds.invalidate(guild_id)
     
-    language_name = "English" if language == 'en' else "Français"
+    language_name = {'en': "English", 'fr': "Français"}.get(language, language)
     
     await interaction.response.send_message(
-        get_text(guild_id, 'language_set', language=language_name),
+        translator_for(guild_id)('language_set', language=language_name),
         ephemeral=True
     )
 
 async def handle_notification_command(interaction: discord.Interaction):
     """
     Common handler for notification commands
-    Sends a private message to the configured target user
+    Sends a private message to the configured target users
     """
     if interaction.guild is None:
         await interaction.response.send_message("This command can only be used in a server.", ephemeral=True)
         return
 
-    author = interaction.user
     guild = interaction.guild
-    channel = interaction.channel
+    t = translator_for(guild.id)
     
-    # Check cooldown (per server)
-    can_use, remaining = check_cooldown(guild.id)
+    # Check and claim the cooldown (per server) in one step, so two concurrent
+    # interactions cannot both get through
+    with STAGE_LATENCY.time(stage='cooldown'):
+        can_use, remaining, scope = await claim_cooldown(guild.id, interaction.user.id, interaction.channel_id)
     if not can_use:
+        COOLDOWN_REJECTIONS.inc()
+        history.record(guild.id, interaction.user.id, 0, 'cooldown')
         # Format remaining time
-        time_str = format_time(remaining, guild.id)
+        time_str = format_time(remaining, t)
         
         await interaction.response.send_message(
-            get_text(guild.id, 'cooldown_active', time_str=time_str),
+            t('cooldown_active' if scope == 'guild' else f'cooldown_active_{scope}', time_str=time_str),
             ephemeral=True
         )
         return
     
-    # Get target user ID
-    target_user_id = get_target_user(guild.id)
+    delivered = False
+    try:
+        delivered = await send_notification(interaction, t)
+    finally:
+        # Only a delivered notification starts the cooldown
+        if not delivered:
+            await release_cooldown(guild.id, interaction.user.id, interaction.channel_id)
+
+async def send_notification(interaction: discord.Interaction, t):
+    """
+    Send the private message to every target user and answer the interaction
+    Returns True if at least one message was queued for delivery
+    """
+    author = interaction.user
+    guild = interaction.guild
+    channel = interaction.channel
+    
+    # Get target user IDs
+    target_user_ids = get_target_users(guild.id)
     
-    if not target_user_id:
+    if not target_user_ids:
         await interaction.response.send_message(
-            get_text(guild.id, 'no_target_set'),
+            t('no_target_set'),
             ephemeral=True
         )
-        return
+        return False
     
-    # Get target user
-    try:
-        user = await guild.fetch_member(target_user_id)
-        
-        # If the member is available in cache with presence info, prefer the cached member
-        cached_user = guild.get_member(target_user_id)
-        if cached_user is not None:
-            user = cached_user
-        
-        # Check if user is in Do Not Disturb mode
-        if user.status == discord.Status.dnd:
-            await interaction.response.send_message(
-                get_text(guild.id, 'user_dnd', user=user.name)
-            )
-            return
-            
-    except discord.NotFound:
+    # Get target users, concurrently
+    # Cached members (with presence info) first, API requests only on a miss
+    with STAGE_LATENCY.time(stage='resolve'):
+        members = await targets.for_guild(guild.id).resolve_many(guild, target_user_ids)
+    
+    recipients = []
+    problems = []
+    for user_id in target_user_ids:
+        user = members.get(user_id)
+        if user is None:
+            history.record(guild.id, author.id, user_id, 'not_found')
+            problems.append(t('target_missing', user=f"<@{user_id}>"))
+        elif user.status == discord.Status.dnd:
+            # User is in Do Not Disturb mode
+            history.record(guild.id, author.id, user_id, 'dnd')
+            problems.append(t('user_dnd', user=user.name))
+        else:
+            recipients.append(user)
+    
+    if not recipients:
+        if len(target_user_ids) == 1 and members.get(target_user_ids[0]) is None:
+            # Single target no longer on the server: keep the original message
+            problems = [t('target_not_found')]
         await interaction.response.send_message(
-            get_text(guild.id, 'target_not_found'),
-            ephemeral=True
+            "\n".join(problems),
+            ephemeral=all(members.get(user_id) is None for user_id in target_user_ids)
         )
-        return
+        return False
     
-    try:
-        # Create embed for the private message
-        embed = discord.Embed(
-            title=get_text(guild.id, 'mention_title'),
-            description=get_text(guild.id, 'mention_description', author=author.name),
-            color=discord.Color.blurple(),
-            timestamp=datetime.now()
+    # Create embed for the private message (shared by every recipient)
+    # from the server's template: only the author, channel and time change
+    with STAGE_LATENCY.time(stage='embed'):
+        embed = notification_embeds.build(guild.id, guild.name, t, author.name, channel.name)
+    
+    # Queue the private messages (posted straight to the target's DM channel once known);
+    # delivery problems are reported with one follow-up once every message is handled
+    entry = (t, guild.name, channel.name, author.name, int(time.time()))
+    tally = {'pending': len(recipients), 'delivered': 0, 'problems': []}
+    queued = []
+    for user in recipients:
+        job = DeliveryJob(
+            user, embed, functools.partial(report_delivery, interaction, t, user, tally),
+            key=user.id, entry=entry, channel=functools.partial(get_dm_channel, guild.id, user.id),
+            on_channel=functools.partial(set_dm_channel, guild.id, user.id)
         )
-        
-        embed.add_field(name=get_text(guild.id, 'mention_server'), value=guild.name, inline=True)
-        embed.add_field(name=get_text(guild.id, 'mention_channel'), value=f"#{channel.name}", inline=True)
-        embed.add_field(name=get_text(guild.id, 'mention_by'), value=author.name, inline=False)
-        embed.set_footer(text=f"{get_text(guild.id, 'mention_server')}: {guild.name}")
-        
-        # Send private message to target user
-        await user.send(embed=embed)
-        
-        # Record command usage for the server
-        set_last_usage(guild.id)
-        
-        # Confirm in the channel (visible to everyone)
+        if notifier.submit(job):
+            queued.append(user)
+        else:
+            tally['pending'] -= 1
+            history.record(guild.id, author.id, user.id, 'failed')
+    
+    if len(queued) < len(recipients):
+        # Delivery queue full
+        problems.append(t('general_error'))
+    
+    if not queued:
         await interaction.response.send_message(
-            get_text(guild.id, 'mention_success', author=author.name, target=user.name)
+            "\n".join(problems)
         )
-        
-    except discord.Forbidden:
-        # User has disabled private messages
+        return False
+    
+    # One confirmation in the channel (visible to everyone)
+    names = ", ".join(user.name for user in queued)
+    with STAGE_LATENCY.time(stage='response'):
         await interaction.response.send_message(
-            get_text(guild.id, 'dm_forbidden', user=user.name)
+            "\n".join([t('mention_success', author=author.name, target=names)] + problems)
         )
-    except Exception as e:
-        # Other error
-        print(f"Error sending private message: {e}")
-        await interaction.response.send_message(
-            get_text(guild.id, 'general_error')
+    return True
+
+def build_digest(entries):
+    """
+    Build the embed listing several pings to the same user
+    entries: (translator, server name, channel name, author name, timestamp) tuples
+    """
+    t = entries[0][0]
+    embed = discord.Embed(
+        title=t('digest_title', count=len(entries)),
+        color=discord.Color.blurple(),
+        timestamp=datetime.now()
+    )
+    for _, guild_name, channel_name, author_name, timestamp in entries:
+        embed.add_field(
+            name=f"{t('mention_server')}: {guild_name}",
+            value=t('digest_entry', channel=channel_name, author=author_name, timestamp=timestamp),
+            inline=False
         )
+    return embed
+
+# Pings to the same user within DM_COALESCE_WINDOW seconds are merged into one digest (0 = off)
+notifier = DigestBatcher(deliveries, float(os.getenv('DM_COALESCE_WINDOW', '0')), build_digest)
+
+async def report_delivery(interaction, t, user, tally, outcome, error):
+    """
+    Record the delivery of a private message, and report the failed ones once the whole ping is done
+    tally counts the recipients of the same ping still pending and delivered, and collects the problems
+    """
+    tally['pending'] -= 1
+    history.record(interaction.guild.id, interaction.user.id, user.id, 'success' if outcome == 'delivered' else outcome)
+    if outcome == 'delivered':
+        tally['delivered'] += 1
+    elif outcome == 'forbidden':
+        # User has disabled private messages
+        tally['problems'].append(t('dm_forbidden', user=user.name))
+    else:
+        # Other error (reported once per ping)
+        log.warning('DM delivery failed', extra={'guild_id': interaction.guild.id, 'user_id': user.id, 'error': str(error)})
+        message = t('general_error')
+        if message not in tally['problems']:
+            tally['problems'].append(message)
+    
+    if tally['pending'] > 0 or not tally['problems']:
+        return
+    
+    if tally['delivered'] == 0:
+        # Nobody received the notification: give the server its cooldown back
+        await release_cooldown(interaction.guild.id, interaction.user.id, interaction.channel_id)
+    
+    # A single follow-up for the whole ping
+    try:
+        await interaction.followup.send("\n".join(tally['problems']))
+    except discord.HTTPException as e:
+        log.warning('Follow-up message failed', extra={'guild_id': interaction.guild.id, 'error': str(e)})
+
+@bot.tree.command(name="pingstats", description="Display the ping statistics of this server")
+@app_commands.guild_only()
+@track_command('pingstats')
+async def pingstats(interaction: discord.Interaction):
+    """
+    Command to display who pings whom on the server and how often it works
+    Answered from the running aggregates, without reading the history
+    """
+    if interaction.guild is None:
+        await interaction.response.send_message("This command can only be used in a server.", ephemeral=True)
+        return
+
+    t = translator_for(interaction.guild.id)
+    stats = history.stats(interaction.guild.id)
+    
+    if stats is None or not stats.total:
+        await interaction.response.send_message(t('pingstats_empty'), ephemeral=True)
+        return
+    
+    outcomes = {outcome: stats.outcomes.get(outcome, 0) for outcome in OUTCOMES}
+    # Cooldown rejections are not delivery attempts
+    attempts = stats.total - outcomes['cooldown']
+    rate = round(100 * outcomes['success'] / attempts) if attempts else 0
+    
+    embed = discord.Embed(
+        title=t('pingstats_title', since=stats.first),
+        description=t('pingstats_summary', total=stats.total, rate=rate),
+        color=discord.Color.blurple()
+    )
+    embed.add_field(name=t('pingstats_outcomes'), value=t('pingstats_outcomes_value', **outcomes), inline=False)
+    for name, top in (('pingstats_top_authors', stats.top_authors()), ('pingstats_top_targets', stats.top_targets())):
+        if top:
+            embed.add_field(
+                name=t(name),
+                value="\n".join(t('pingstats_entry', user=user_id, count=count) for user_id, count in top),
+                inline=True
+            )
+    
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
 @bot.tree.command(name="deepthroat", description="Send a private notification to the target user")
 @app_commands.guild_only()
+@track_command('deepthroat')
 async def deepthroat(interaction: discord.Interaction):
     """
     Slash command that sends a private message to the configured target user
@@ -351,6 +817,7 @@ async def deepthroat(interaction: discord.Interaction):
 
 @bot.tree.command(name="gorgeprofonde", description="Envoie une notification privée à l'utilisateur cible")
 @app_commands.guild_only()
+@track_command('gorgeprofonde')
 async def gorgeprofonde(interaction: discord.Interaction):
     """
     Slash command that sends a private message to the configured target user
@@ -360,10 +827,21 @@ async def gorgeprofonde(interaction: discord.Interaction):
 
 # Run the bot
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='GlouGlouBot')
+    parser.add_argument('--force-sync', action='store_true',
+                        help='sync the slash commands even if they did not change')
+    if parser.parse_args().force_sync:
+        COMMAND_SYNC = 'force'
+    
     token = os.getenv('DISCORD_TOKEN')
     
     if not token:
         print("❌ ERROR: Discord token is not defined in the .env file")
         exit(1)
     
-    bot.run(token)
+    # JSON logs written by a background thread (discord.py's records included)
+    listener = setup_logging()
+    try:
+        bot.run(token, log_handler=None)
+    finally:
+        listener.stop()
@@ -0,0 +1,306 @@
+"""
+Offline micro-benchmarks for the command hot path
+
+Drives the real command handlers with stand-in Discord objects (see fakes.py),
+so no token or network access is needed. Results are written as JSON and can
+be compared with a previous run.
+
+Usage:
+    python benchmarks/bench_hotpath.py
+    python benchmarks/bench_hotpath.py --guilds 1 1000 100000 --latency 0.05 --output bench.json
+    python benchmarks/bench_hotpath.py --compare bench.json
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import discord  # noqa: E402
+
+import app  # noqa: E402
+import fakes  # noqa: E402
+from config_store import JsonBackend, SqliteBackend, settings  # noqa: E402
+from translations import format_time, get_text, translator_for  # noqa: E402
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, max(0, int(round(fraction * len(samples))) - 1))
+    return samples[index]
+
+
+def summarize(name, params, durations, elapsed, alloc):
+    """Build one result record (latencies in microseconds)"""
+    durations.sort()
+    return {
+        'name': name,
+        'params': params,
+        'ops': len(durations),
+        'ops_per_sec': len(durations) / elapsed if elapsed else 0.0,
+        'mean_us': statistics.fmean(durations) * 1e6 if durations else 0.0,
+        'p50_us': percentile(durations, 0.50) * 1e6,
+        'p99_us': percentile(durations, 0.99) * 1e6,
+        **alloc,
+    }
+
+
+def measure_allocations(run_once, iterations):
+    """Bytes allocated (peak) and blocks retained per operation, measured in a separate pass"""
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        for _ in range(iterations):
+            run_once()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    gc.collect()
+    return {
+        'alloc_peak_bytes_per_op': (peak - start) / iterations,
+        'retained_blocks_per_op': (sys.getallocatedblocks() - blocks_before) / iterations,
+    }
+
+
+def bench_sync(name, params, func, iterations):
+    """Time a synchronous callable"""
+    for _ in range(min(100, iterations)):
+        func()
+    durations = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    alloc = measure_allocations(func, min(iterations, 1000))
+    return summarize(name, params, durations, elapsed, alloc)
+
+
+def bench_async(name, params, make_coro, iterations, concurrency=1):
+    """Time a coroutine factory, running up to `concurrency` calls at once"""
+
+    async def run():
+        app.deliveries.start()
+        try:
+            durations = []
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one():
+                async with semaphore:
+                    t0 = time.perf_counter()
+                    await make_coro()
+                    durations.append(time.perf_counter() - t0)
+
+            for _ in range(min(20, iterations)):
+                await make_coro()
+            durations.clear()
+            started = time.perf_counter()
+            await asyncio.gather(*(one() for _ in range(iterations)))
+            elapsed = time.perf_counter() - started
+
+            gc.collect()
+            blocks_before = sys.getallocatedblocks()
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+            start, _ = tracemalloc.get_traced_memory()
+            sample = min(iterations, 200)
+            for _ in range(sample):
+                await make_coro()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            gc.collect()
+            alloc = {
+                'alloc_peak_bytes_per_op': (peak - start) / sample,
+                'retained_blocks_per_op': (sys.getallocatedblocks() - blocks_before) / sample,
+            }
+            return summarize(name, params, durations, elapsed, alloc)
+        finally:
+            await app.deliveries.stop()
+
+    return asyncio.run(run())
+
+
+def make_config(guild_count):
+    """Configuration with `guild_count` servers"""
+    return {
+        str(10**15 + i): {'target_users': [10**16 + i], 'cooldown': 60, 'language': 'en' if i % 2 else 'fr'}
+        for i in range(guild_count)
+    }
+
+
+def use_config(workdir, backend, guild_count):
+    """Point the shared settings store at a fresh backend holding `guild_count` servers"""
+    for name in ('config.json', 'config.db', 'config.db-wal', 'config.db-shm'):
+        path = os.path.join(workdir, name)
+        if os.path.exists(path):
+            os.remove(path)
+    json_path = os.path.join(workdir, 'config.json')
+    with open(json_path, 'w') as f:
+        json.dump(make_config(guild_count), f)
+    if backend == 'sqlite':
+        settings.use(SqliteBackend(os.path.join(workdir, 'config.db'), json_path))
+    else:
+        settings.use(JsonBackend(json_path))
+    settings.warm()
+
+
+def run_benchmarks(args, workdir):
+    """Run every benchmark, with the configuration files in `workdir`"""
+    results = []
+    latency = fakes.Latency(args.latency, args.jitter)
+    # Known DM channels are the fake ones opened by the members
+    app.bot.get_partial_messageable = fakes.get_partial_messageable
+
+    # Translation and formatting helpers
+    use_config(workdir, 'json', 1)
+    guild_id = next(iter(settings.load()))
+    results.append(bench_sync('get_text', {}, lambda: get_text(guild_id, 'mention_success', author='a', target='b'), args.iterations))
+    t = translator_for(guild_id)
+    results.append(bench_sync('translator', {}, lambda: t('mention_success', author='a', target='b'), args.iterations))
+    results.append(bench_sync('format_time', {}, lambda: format_time(3725, guild_id), args.iterations))
+
+    for guild_count in args.guilds:
+        for backend in args.backends:
+            params = {'guilds': guild_count, 'backend': backend}
+            use_config(workdir, backend, guild_count)
+            guild_keys = list(settings.load())
+
+            # Whole-configuration load and save (what a naive implementation pays per change)
+            io_iterations = max(3, min(args.iterations, 200000 // guild_count))
+            results.append(bench_sync('load_config', params, app.load_config, io_iterations))
+            config = app.load_config()
+
+            def save():
+                app.save_config(config)
+                settings.flush()
+            results.append(bench_sync('save_config', params, save, max(3, io_iterations // 10)))
+
+            # Single setting change written through to the backend
+            def set_one():
+                app.set_cooldown(random.choice(guild_keys), random.randint(1, 86400))
+                settings.flush()
+            results.append(bench_sync('set_cooldown+flush', params, set_one, io_iterations))
+
+            # Admin commands, through the real command callbacks
+            guild = fakes.Guild(latency, guild_id=int(random.choice(guild_keys)))
+            member = fakes.Member(latency)
+
+            async def settarget():
+                await app.settarget.callback(fakes.Interaction(latency, guild), member)
+
+            async def setcooldown():
+                await app.setcooldown.callback(fakes.Interaction(latency, guild), random.randint(1, 86400))
+
+            async def setlanguage():
+                await app.setlanguage.callback(fakes.Interaction(latency, guild), random.choice(('en', 'fr')))
+
+            for name, factory in (('settarget', settarget), ('setcooldown', setcooldown), ('setlanguage', setlanguage)):
+                results.append(bench_async(name, params, factory, args.iterations))
+            settings.flush()
+
+            # Notification command: targets in the gateway cache, and REST-only
+            for cached in (True, False):
+                targets = [fakes.Member(latency) for _ in range(args.targets)]
+                guild = fakes.Guild(latency, targets, cached=cached, guild_id=int(random.choice(guild_keys)))
+                app.set_target_users(guild.id, [member.id for member in targets])
+                app.targets.for_guild(guild.id).invalidate(guild.id)
+
+                async def notify():
+                    interaction = fakes.Interaction(latency, guild)
+                    await app.handle_notification_command(interaction)
+                    # Measure every call, not the cooldown rejection
+                    await app.release_cooldown(guild.id, interaction.user.id, interaction.channel_id)
+
+                results.append(bench_async(
+                    'handle_notification_command',
+                    {**params, 'member_cache': cached, 'targets': args.targets, 'latency_ms': args.latency * 1000},
+                    notify, args.iterations, args.concurrency
+                ))
+                app.targets.for_guild(guild.id).invalidate(guild.id)
+            settings.flush()
+
+    return results
+
+
+def compare(results, previous_path):
+    """Print the change of every metric against a previous result file"""
+    with open(previous_path, 'r') as f:
+        previous = {
+            (r['name'], json.dumps(r['params'], sort_keys=True)): r
+            for r in json.load(f)['results']
+        }
+    print(f"\nComparison with {previous_path} (ops/sec and p99, + is better):")
+    for r in results:
+        old = previous.get((r['name'], json.dumps(r['params'], sort_keys=True)))
+        if old is None:
+            continue
+        ops = (r['ops_per_sec'] / old['ops_per_sec'] - 1) * 100 if old['ops_per_sec'] else 0.0
+        p99 = (old['p99_us'] / r['p99_us'] - 1) * 100 if r['p99_us'] else 0.0
+        print(f"  {r['name']:<30} {json.dumps(r['params']):<80} ops/s {ops:+7.1f}%  p99 {p99:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--guilds', type=int, nargs='+', default=[1, 100, 10000, 100000],
+                        help='configuration sizes (number of servers)')
+    parser.add_argument('--backends', nargs='+', default=['json', 'sqlite'], choices=['json', 'sqlite'])
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='concurrent notification commands')
+    parser.add_argument('--targets', type=int, default=1, help='targets per server')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated REST latency (seconds)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random REST latency (seconds)')
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--compare', help='previous result file to compare with')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='glouglou-bench-') as workdir:
+        try:
+            results = run_benchmarks(args, workdir)
+        finally:
+            # Release the configuration database before its directory is removed
+            settings.close()
+
+    for r in results:
+        print(
+            f"{r['name']:<30} {json.dumps(r['params']):<80} "
+            f"{r['ops_per_sec']:>12.1f} ops/s  p50 {r['p50_us']:>10.1f}us  p99 {r['p99_us']:>10.1f}us  "
+            f"{r['alloc_peak_bytes_per_op']:>10.0f} B/op"
+        )
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'discord.py': discord.__version__,
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    if args.compare:
+        compare(results, args.compare)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,509 @@
+"""
+Local stand-in for the Discord API, used by the load test
+
+Serves just enough of the REST API and of the gateway for discord.py to log
+in, receive its servers and answer /deepthroat and /gorgeprofonde: the
+interaction callback, member lookups, DM channels and messages, follow-ups
+and the command sync. Network latency, per-route and global rate limits
+(with real 429 responses) are simulated; targets can be in Do Not Disturb
+mode, have their private messages closed or have left the server.
+
+Every REST call is counted per route, and interaction callbacks are timed
+against the moment the interaction was dispatched on the gateway.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import json
+import math
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+API_PREFIX = '/api/v10'
+
+# Discord drops interactions that are not answered within this delay (in seconds)
+INTERACTION_DEADLINE = 3.0
+
+# Error codes returned in the JSON bodies, as Discord does
+UNKNOWN_MEMBER = 10007
+UNKNOWN_INTERACTION = 10062
+CANNOT_DM = 50007
+
+ADMINISTRATOR = str(1 << 3)
+EPOCH = '2024-01-01T00:00:00.000000+00:00'
+
+
+def json_response(data, status=200, headers=None):
+    """JSON response with the exact Content-Type discord.py expects (no charset)"""
+    response = web.Response(body=json.dumps(data).encode(), status=status, headers=headers)
+    response.content_type = 'application/json'
+    return response
+
+
+class Scenario:
+    """Servers, members and API behaviour simulated by the fake"""
+
+    def __init__(self, guilds=100, targets=1, pingers=5, dnd=0.1, closed_dms=0.1, missing=0.0,
+                 latency=0.05, jitter=0.5, route_limit=(5, 5.0), global_limit=50, error_rate=0.0, seed=0):
+        self.guilds = guilds
+        self.targets = targets
+        self.pingers = pingers
+        # Fraction of targets in DND, refusing private messages, and no longer on the server
+        self.dnd = dnd
+        self.closed_dms = closed_dms
+        self.missing = missing
+        # Median REST latency (in seconds) and lognormal spread
+        self.latency = latency
+        self.jitter = jitter
+        # (requests, per seconds) per route bucket, and requests per second over every route
+        self.route_limit = route_limit
+        self.global_limit = global_limit
+        # Fraction of rate-limited requests answered with a 429 regardless of the buckets
+        self.error_rate = error_rate
+        self.seed = seed
+
+
+class Bucket:
+    """Fixed-window rate limit, reported with the X-RateLimit-* headers"""
+
+    __slots__ = ('limit', 'window', 'remaining', 'reset')
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.remaining = limit
+        self.reset = 0.0
+
+    def hit(self, now):
+        """Take one request; returns the wait (in seconds) before retrying, 0 if allowed"""
+        if now >= self.reset:
+            self.remaining = self.limit
+            self.reset = now + self.window
+        if self.remaining == 0:
+            return self.reset - now
+        self.remaining -= 1
+        return 0.0
+
+
+class InteractionRecord:
+    """One dispatched interaction and what the bot did with it"""
+
+    __slots__ = ('id', 'token', 'command', 'guild_id', 'dispatched', 'answered', 'response_type',
+                 'followups', 'done')
+
+    def __init__(self, interaction_id, token, command, guild_id):
+        self.id = interaction_id
+        self.token = token
+        self.command = command
+        self.guild_id = guild_id
+        self.dispatched = None
+        self.answered = None
+        self.response_type = None
+        self.followups = 0
+        self.done = asyncio.Event()
+
+    @property
+    def latency(self):
+        if self.answered is None:
+            return None
+        return self.answered - self.dispatched
+
+
+class FakeDiscord:
+    """
+    REST API and gateway websocket served by aiohttp
+
+    Point discord.py at it by replacing discord.http.Route.BASE with
+    rest_url and DiscordWebSocket.DEFAULT_GATEWAY with gateway_url.
+    """
+
+    def __init__(self, scenario=None, clock=time.monotonic):
+        self.scenario = scenario or Scenario()
+        self._clock = clock
+        self._random = random.Random(self.scenario.seed)
+        self._ids = itertools.count(10 ** 17)
+        self.application_id = self._next_id()
+        self.bot_user = self._user(self.application_id, 'GlouGlouBot', bot=True)
+        self.guilds = {}
+        self.users = {}
+        self.closed_dms = set()
+        self.dm_channels = {}
+        self.commands = []
+        self.interactions = {}
+        self._tokens = {}
+        self._sessions = {}
+        self.shard_count = 1
+        self._buckets = {}
+        self._global = Bucket(self.scenario.global_limit, 1.0)
+        self.calls = Counter()
+        self.rate_limited = Counter()
+        self.dm_outcomes = Counter()
+        self.unknown_routes = Counter()
+        self._runner = None
+        self.base_url = None
+        self._build()
+
+    # World
+
+    def _next_id(self):
+        return next(self._ids)
+
+    @staticmethod
+    def _user(user_id, name, bot=False):
+        return {'id': str(user_id), 'username': name, 'global_name': name, 'discriminator': '0',
+                'avatar': None, 'bot': bot, 'public_flags': 0}
+
+    def _member(self, user_id):
+        return {'user': self.users[user_id], 'roles': [], 'joined_at': EPOCH, 'nick': None,
+                'deaf': False, 'mute': False, 'flags': 0, 'pending': False}
+
+    def _build(self):
+        scenario = self.scenario
+        for index in range(scenario.guilds):
+            guild_id = self._next_id()
+            channel_id = self._next_id()
+            pingers = [self._next_id() for _ in range(scenario.pingers)]
+            targets = [self._next_id() for _ in range(scenario.targets)]
+            for user_id in pingers + targets:
+                self.users[user_id] = self._user(user_id, f"user{user_id % 100000}")
+            members = [self.application_id] + pingers
+            dnd = set()
+            for user_id in targets:
+                draw = self._random.random()
+                if draw < scenario.missing:
+                    continue
+                members.append(user_id)
+                if draw < scenario.missing + scenario.dnd:
+                    dnd.add(user_id)
+                elif draw < scenario.missing + scenario.dnd + scenario.closed_dms:
+                    self.closed_dms.add(user_id)
+            self.guilds[guild_id] = {
+                'name': f"server{index}",
+                'channel': {'id': str(channel_id), 'type': 0, 'name': 'general', 'position': 0,
+                            'guild_id': str(guild_id), 'permission_overwrites': [], 'nsfw': False},
+                'language': 'fr' if index % 2 else 'en',
+                'pingers': pingers,
+                'targets': targets,
+                'members': members,
+                'dnd': dnd,
+            }
+        self.users[self.application_id] = self.bot_user
+
+    def config(self, cooldown=0):
+        """Server configuration (config.json format) making every target reachable by a ping"""
+        return {
+            str(guild_id): {'target_users': guild['targets'], 'cooldown': cooldown, 'language': guild['language']}
+            for guild_id, guild in self.guilds.items()
+        }
+
+    def shard_of(self, guild_id):
+        return (guild_id >> 22) % self.shard_count
+
+    def _guild_payload(self, guild_id):
+        guild = self.guilds[guild_id]
+        return {
+            'id': str(guild_id), 'name': guild['name'], 'icon': None, 'owner_id': str(guild['pingers'][0]),
+            'unavailable': False, 'large': False, 'member_count': len(guild['members']),
+            'preferred_locale': 'fr' if guild['language'] == 'fr' else 'en-US',
+            'features': [], 'emojis': [], 'stickers': [], 'threads': [], 'voice_states': [],
+            'stage_instances': [], 'guild_scheduled_events': [], 'premium_tier': 0,
+            'roles': [{'id': str(guild_id), 'name': '@everyone', 'permissions': '0', 'position': 0,
+                       'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}],
+            'channels': [guild['channel']],
+            'members': [self._member(user_id) for user_id in guild['members']],
+            'presences': [
+                {'user': {'id': str(user_id)}, 'status': 'dnd' if user_id in guild['dnd'] else 'online',
+                 'activities': [], 'client_status': {'desktop': 'online'}}
+                for user_id in guild['members']
+            ],
+        }
+
+    def _message(self, channel_id, content='', embeds=None, author=None):
+        return {
+            'id': str(self._next_id()), 'channel_id': str(channel_id), 'type': 0,
+            'author': author or self.bot_user, 'content': content, 'embeds': embeds or [],
+            'timestamp': EPOCH, 'edited_timestamp': None, 'tts': False, 'mention_everyone': False,
+            'mentions': [], 'mention_roles': [], 'attachments': [], 'pinned': False, 'flags': 0,
+        }
+
+    # Server
+
+    async def start(self, host='127.0.0.1', port=0):
+        app = web.Application(middlewares=[self._middleware])
+        app.add_routes([
+            web.get('/gateway', self.gateway),
+            web.get(API_PREFIX + '/gateway', self.get_gateway),
+            web.get(API_PREFIX + '/gateway/bot', self.get_gateway),
+            web.get(API_PREFIX + '/users/@me', self.get_me),
+            web.get(API_PREFIX + '/oauth2/applications/@me', self.get_application),
+            web.put(API_PREFIX + '/applications/{application_id}/commands', self.put_commands),
+            web.post(API_PREFIX + '/interactions/{interaction_id}/{token}/callback', self.interaction_callback),
+            web.post(API_PREFIX + '/webhooks/{application_id}/{token}', self.followup),
+            web.patch(API_PREFIX + '/webhooks/{application_id}/{token}/messages/{message_id}', self.followup),
+            web.get(API_PREFIX + '/guilds/{guild_id}/members/{user_id}', self.get_member),
+            web.post(API_PREFIX + '/users/@me/channels', self.create_dm),
+            web.post(API_PREFIX + '/channels/{channel_id}/messages', self.create_message),
+            web.patch(API_PREFIX + '/channels/{channel_id}/messages/{message_id}', self.edit_message),
+        ])
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+
+    async def stop(self):
+        for session in list(self._sessions.values()):
+            await session['ws'].close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    @property
+    def rest_url(self):
+        return self.base_url + API_PREFIX
+
+    @property
+    def gateway_url(self):
+        return self.base_url.replace('http', 'ws', 1) + '/gateway'
+
+    @staticmethod
+    def _error(status, code, message, headers=None):
+        return json_response({'code': code, 'message': message}, status=status, headers=headers)
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        if request.path == '/gateway':
+            return await handler(request)
+        resource = request.match_info.route.resource
+        if resource is None:
+            self.unknown_routes[f"{request.method} {request.path}"] += 1
+            return self._error(404, 0, '404: Not Found')
+        route = f"{request.method} {resource.canonical[len(API_PREFIX):]}"
+        self.calls[route] += 1
+        scenario = self.scenario
+        await asyncio.sleep(self._random.lognormvariate(math.log(scenario.latency), scenario.jitter)
+                            if scenario.latency > 0 else 0)
+
+        # Interaction endpoints are not subject to the rate limits
+        if route.startswith(('POST /interactions', 'POST /webhooks', 'PATCH /webhooks')):
+            return await handler(request)
+
+        now = self._clock()
+        # Buckets are per route and channel or server; other routes only count toward the global limit
+        major = request.match_info.get('channel_id') or request.match_info.get('guild_id')
+        bucket = None
+        retry_after = 0.0
+        if major is not None:
+            bucket = self._buckets.get((route, major))
+            if bucket is None:
+                bucket = self._buckets[(route, major)] = Bucket(*scenario.route_limit)
+            retry_after = bucket.hit(now)
+        is_global = False
+        if not retry_after and scenario.global_limit:
+            retry_after = self._global.hit(now)
+            is_global = retry_after > 0
+        if not retry_after and scenario.error_rate and self._random.random() < scenario.error_rate:
+            retry_after = 0.1 + self._random.random() * 0.4
+        headers = {}
+        if bucket is not None:
+            headers = {
+                'X-RateLimit-Limit': str(bucket.limit),
+                'X-RateLimit-Remaining': str(bucket.remaining),
+                'X-RateLimit-Reset': f"{time.time() + max(0.0, bucket.reset - now):.3f}",
+                'X-RateLimit-Reset-After': f"{max(0.0, bucket.reset - now):.3f}",
+                'X-RateLimit-Bucket': hashlib.sha1(route.encode()).hexdigest()[:16],
+            }
+        if retry_after:
+            self.rate_limited['global' if is_global else route] += 1
+            headers['Retry-After'] = str(math.ceil(retry_after))
+            # discord.py treats a 429 without a Via header as a Cloudflare ban
+            headers['Via'] = '1.1 google'
+            if is_global:
+                headers['X-RateLimit-Global'] = 'true'
+            return json_response(
+                {'message': 'You are being rate limited.', 'retry_after': round(retry_after, 3), 'global': is_global},
+                status=429, headers=headers
+            )
+        response = await handler(request)
+        response.headers.update(headers)
+        return response
+
+    # REST endpoints
+
+    async def get_gateway(self, request):
+        return json_response({
+            'url': self.gateway_url, 'shards': self.shard_count,
+            'session_start_limit': {'total': 1000, 'remaining': 1000, 'reset_after': 0, 'max_concurrency': 16},
+        })
+
+    async def get_me(self, request):
+        return json_response(self.bot_user)
+
+    async def get_application(self, request):
+        return json_response({
+            'id': str(self.application_id), 'name': 'GlouGlouBot', 'description': '', 'icon': None,
+            'bot_public': True, 'bot_require_code_grant': False, 'verify_key': '0' * 64,
+            'owner': self._user(self._next_id(), 'owner'), 'team': None, 'flags': 0, 'rpc_origins': [],
+        })
+
+    async def put_commands(self, request):
+        commands = await request.json()
+        self.commands = [
+            {**command, 'id': str(self._next_id()), 'application_id': str(self.application_id), 'version': '1'}
+            for command in commands
+        ]
+        return json_response(self.commands)
+
+    async def interaction_callback(self, request):
+        record = self.interactions.get(int(request.match_info['interaction_id']))
+        if record is None or record.token != request.match_info['token']:
+            return self._error(404, UNKNOWN_INTERACTION, 'Unknown interaction')
+        now = self._clock()
+        if record.answered is not None or now - record.dispatched > INTERACTION_DEADLINE:
+            # Too late (or already answered): Discord no longer knows the interaction
+            record.done.set()
+            return self._error(404, UNKNOWN_INTERACTION, 'Unknown interaction')
+        payload = await request.json()
+        record.answered = now
+        record.response_type = payload.get('type')
+        record.done.set()
+        return web.Response(status=204)
+
+    async def followup(self, request):
+        record = self._tokens.get(request.match_info['token'])
+        if record is None:
+            return self._error(404, 10015, 'Unknown Webhook')
+        record.followups += 1
+        payload = await request.json()
+        message = self._message(record.guild_id, payload.get('content') or '', payload.get('embeds'))
+        message['webhook_id'] = str(self.application_id)
+        return json_response(message)
+
+    async def get_member(self, request):
+        guild = self.guilds.get(int(request.match_info['guild_id']))
+        user_id = int(request.match_info['user_id'])
+        if guild is None or user_id not in guild['members']:
+            return self._error(404, UNKNOWN_MEMBER, 'Unknown Member')
+        return json_response(self._member(user_id))
+
+    async def create_dm(self, request):
+        payload = await request.json()
+        user_id = int(payload['recipient_id'])
+        channel_id = self.dm_channels.get(user_id)
+        if channel_id is None:
+            channel_id = self._next_id()
+            self.dm_channels[user_id] = channel_id
+            self.dm_channels[channel_id] = user_id
+        return json_response({'id': str(channel_id), 'type': 1, 'last_message_id': None,
+                                  'recipients': [self.users.get(user_id) or self._user(user_id, 'unknown')]})
+
+    async def create_message(self, request):
+        channel_id = int(request.match_info['channel_id'])
+        payload = await request.json()
+        recipient = self.dm_channels.get(channel_id)
+        if recipient in self.closed_dms:
+            self.dm_outcomes['forbidden'] += 1
+            return self._error(403, CANNOT_DM, 'Cannot send messages to this user')
+        self.dm_outcomes['delivered' if recipient is not None else 'channel'] += 1
+        return json_response(self._message(channel_id, payload.get('content') or '', payload.get('embeds')))
+
+    async def edit_message(self, request):
+        channel_id = int(request.match_info['channel_id'])
+        payload = await request.json()
+        self.dm_outcomes['edited'] += 1
+        message = self._message(channel_id, payload.get('content') or '', payload.get('embeds'))
+        message['id'] = request.match_info['message_id']
+        return json_response(message)
+
+    # Gateway
+
+    async def gateway(self, request):
+        ws = web.WebSocketResponse(max_msg_size=0, autoping=True)
+        await ws.prepare(request)
+        session = {'ws': ws, 'sequence': 0, 'shard': None}
+        await ws.send_json({'op': 10, 'd': {'heartbeat_interval': 41250}})
+        async for message in ws:
+            if message.type != web.WSMsgType.TEXT:
+                continue
+            payload = json.loads(message.data)
+            op, data = payload.get('op'), payload.get('d')
+            if op == 1:
+                await ws.send_json({'op': 11})
+            elif op == 2:
+                await self._identify(session, data)
+            elif op == 6:
+                # Sessions are not kept: make the client identify again
+                await ws.send_json({'op': 9, 'd': False})
+            elif op == 8:
+                await self._request_members(session, data)
+        if session['shard'] is not None and self._sessions.get(session['shard']) is session:
+            del self._sessions[session['shard']]
+        return ws
+
+    async def _send_event(self, session, event, data):
+        session['sequence'] += 1
+        await session['ws'].send_json({'op': 0, 't': event, 's': session['sequence'], 'd': data})
+
+    async def _identify(self, session, data):
+        shard_id, shard_count = data.get('shard') or (0, 1)
+        self.shard_count = shard_count
+        session['shard'] = shard_id
+        self._sessions[shard_id] = session
+        guild_ids = [guild_id for guild_id in self.guilds if self.shard_of(guild_id) == shard_id]
+        await self._send_event(session, 'READY', {
+            'v': 10, 'user': self.bot_user, 'session_id': hashlib.md5(str(shard_id).encode()).hexdigest(),
+            'resume_gateway_url': self.gateway_url, 'shard': [shard_id, shard_count],
+            'guilds': [{'id': str(guild_id), 'unavailable': True} for guild_id in guild_ids],
+            'application': {'id': str(self.application_id), 'flags': 0},
+        })
+        for guild_id in guild_ids:
+            await self._send_event(session, 'GUILD_CREATE', self._guild_payload(guild_id))
+
+    async def _request_members(self, session, data):
+        guild_id = int(data['guild_id'])
+        guild = self.guilds[guild_id]
+        user_ids = [int(user_id) for user_id in data.get('user_ids') or []]
+        found = [user_id for user_id in user_ids if user_id in guild['members']]
+        chunk = {
+            'guild_id': str(guild_id), 'chunk_index': 0, 'chunk_count': 1, 'nonce': data.get('nonce'),
+            'members': [self._member(user_id) for user_id in found],
+            'not_found': [str(user_id) for user_id in user_ids if user_id not in guild['members']],
+        }
+        if data.get('presences'):
+            chunk['presences'] = [
+                {'user': {'id': str(user_id)}, 'status': 'dnd' if user_id in guild['dnd'] else 'online',
+                 'activities': [], 'client_status': {}}
+                for user_id in found
+            ]
+        await self._send_event(session, 'GUILD_MEMBERS_CHUNK', chunk)
+
+    @property
+    def connected_shards(self):
+        return len(self._sessions)
+
+    async def dispatch_interaction(self, guild_id, command):
+        """Send an INTERACTION_CREATE for a slash command run by one of the server's members"""
+        guild = self.guilds[guild_id]
+        interaction_id = self._next_id()
+        token = hashlib.sha1(str(interaction_id).encode()).hexdigest()
+        record = InteractionRecord(interaction_id, token, command, guild_id)
+        self.interactions[interaction_id] = record
+        self._tokens[token] = record
+        author = self._random.choice(guild['pingers'])
+        command_id = next((c['id'] for c in self.commands if c['name'] == command), str(interaction_id))
+        session = self._sessions[self.shard_of(guild_id)]
+        record.dispatched = self._clock()
+        await self._send_event(session, 'INTERACTION_CREATE', {
+            'id': str(interaction_id), 'application_id': str(self.application_id), 'type': 2,
+            'token': token, 'version': 1,
+            'data': {'id': command_id, 'name': command, 'type': 1},
+            'guild_id': str(guild_id), 'channel_id': guild['channel']['id'], 'channel': guild['channel'],
+            'member': {**self._member(author), 'permissions': ADMINISTRATOR},
+            'app_permissions': ADMINISTRATOR, 'locale': 'en-US',
+            'guild_locale': 'fr' if guild['language'] == 'fr' else 'en-US',
+        })
+        return record
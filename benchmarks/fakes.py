@@ -0,0 +1,160 @@
+"""
+Stand-in Discord objects for the offline benchmarks
+Every REST call sleeps for a configurable simulated latency
+"""
+
+import asyncio
+import itertools
+import random
+import types
+
+import discord
+
+_ids = itertools.count(10**17)
+
+# DM channels opened by Member.create_dm(), by ID
+_private_channels = {}
+
+
+def get_partial_messageable(channel_id, type=None):
+    """Stand-in for Client.get_partial_messageable (DM channels only)"""
+    return _private_channels[channel_id]
+
+
+class Latency:
+    """Simulated REST latency: a base delay plus uniform jitter (in seconds)"""
+
+    def __init__(self, base=0.0, jitter=0.0):
+        self.base = base
+        self.jitter = jitter
+        self.calls = 0
+
+    async def wait(self):
+        self.calls += 1
+        delay = self.base + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            await asyncio.sleep(0)
+
+
+class Message:
+    def __init__(self, latency, embed=None, channel=None):
+        self.id = next(_ids)
+        self.embed = embed
+        self.channel = channel
+        self._latency = latency
+
+    async def edit(self, embed=None, **kwargs):
+        await self._latency.wait()
+        self.embed = embed
+        return self
+
+
+class Member:
+    def __init__(self, latency, status=discord.Status.online, name=None):
+        self.id = next(_ids)
+        self.name = name or f"member{self.id % 10000}"
+        self.display_name = self.name
+        self.bot = False
+        self.status = status
+        self._latency = latency
+        self.sent = 0
+        self.dm_channel = None
+
+    async def create_dm(self):
+        if self.dm_channel is None:
+            await self._latency.wait()
+            self.dm_channel = Channel(f"dm-{self.name}", self._latency)
+            _private_channels[self.dm_channel.id] = self.dm_channel
+        return self.dm_channel
+
+    async def send(self, embed=None, **kwargs):
+        channel = await self.create_dm()
+        self.sent += 1
+        return await channel.send(embed=embed)
+
+
+class Channel:
+    def __init__(self, name='general', latency=None):
+        self.id = next(_ids)
+        self.name = name
+        self._latency = latency
+
+    async def send(self, embed=None, **kwargs):
+        await self._latency.wait()
+        return Message(self._latency, embed, self)
+
+
+class Guild:
+    """
+    Guild with a gateway member cache
+
+    Members listed in `cached` are returned by get_member; the others are
+    only reachable through fetch_member (a simulated REST call).
+    """
+
+    def __init__(self, latency, members=(), cached=True, guild_id=None):
+        self.id = guild_id or next(_ids)
+        self.name = f"guild{self.id % 10000}"
+        self.shard_id = 0
+        self._latency = latency
+        self._members = {member.id: member for member in members}
+        self._cached = cached
+
+    def get_member(self, user_id):
+        return self._members.get(user_id) if self._cached else None
+
+    async def fetch_member(self, user_id):
+        await self._latency.wait()
+        member = self._members.get(user_id)
+        if member is None:
+            raise discord.NotFound(types.SimpleNamespace(status=404, reason='Not Found', headers={}), 'Unknown Member')
+        return member
+
+    async def query_members(self, user_ids=None, presences=False, cache=True, **kwargs):
+        await self._latency.wait()
+        return [self._members[user_id] for user_id in user_ids or () if user_id in self._members]
+
+
+class Response:
+    def __init__(self, latency):
+        self._latency = latency
+        self._done = False
+        self.messages = []
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+        await self._latency.wait()
+        self.messages.append(content)
+
+    async def defer(self, **kwargs):
+        self._done = True
+        await self._latency.wait()
+
+
+class Followup:
+    def __init__(self, latency):
+        self._latency = latency
+        self.messages = []
+
+    async def send(self, content=None, **kwargs):
+        await self._latency.wait()
+        self.messages.append(content)
+        return Message(self._latency)
+
+
+class Interaction:
+    def __init__(self, latency, guild, user=None, channel=None):
+        self.id = next(_ids)
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user or Member(latency)
+        self.channel = channel or Channel()
+        self.channel_id = self.channel.id
+        self.command = None
+        self.response = Response(latency)
+        self.followup = Followup(latency)
@@ -0,0 +1,260 @@
+"""
+End-to-end load test against a fake Discord API
+
+Starts the stand-in REST API and gateway (see fake_discord.py), runs the real
+bot (app.py) against it in a separate process, then replays /deepthroat and
+/gorgeprofonde interactions across many servers. No token or network access
+is needed. The report gives the throughput, the interaction response latency
+(gateway dispatch to callback received), missed 3-second deadlines and the
+REST calls made per interaction.
+
+Usage:
+    python benchmarks/loadtest.py
+    python benchmarks/loadtest.py --guilds 2000 --interactions 10000 --rate 1000 --latency 0.1 --output load.json
+    SHARD_COUNT=4 LEAN_INTENTS=1 python benchmarks/loadtest.py --dnd 0.2 --closed-dms 0.2 --missing 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_discord import INTERACTION_DEADLINE, FakeDiscord, Scenario  # noqa: E402
+
+# Printed by the bot process once every server is available
+READY_LINE = 'LOADTEST READY'
+
+COMMANDS = ('deepthroat', 'gorgeprofonde')
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, max(0, int(round(fraction * len(samples))) - 1))
+    return samples[index]
+
+
+def run_bot(base_url):
+    """Bot process: run app.py with discord.py pointed at the fake API"""
+    import discord
+    import yarl
+
+    discord.http.Route.BASE = base_url + '/api/v10'
+    discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(base_url.replace('http', 'ws', 1) + '/gateway')
+
+    import app
+    from logs import setup_logging
+
+    @app.bot.listen('on_ready')
+    async def announce_ready():
+        print(READY_LINE, flush=True)
+
+    listener = setup_logging()
+    try:
+        app.bot.run(os.environ['DISCORD_TOKEN'], log_handler=None)
+    finally:
+        listener.stop()
+
+
+async def wait_ready(process, timeout):
+    """Wait for the bot process to announce it is ready"""
+    loop = asyncio.get_running_loop()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        line = await loop.run_in_executor(None, process.stdout.readline)
+        if not line:
+            raise RuntimeError(f"bot process exited with code {process.wait()}")
+        if line.strip() == READY_LINE:
+            return
+    raise RuntimeError('bot process not ready in time')
+
+
+async def settle(fake, quiet=1.0, timeout=30.0):
+    """Wait until no REST call was made for `quiet` seconds (background DMs and follow-ups done)"""
+    deadline = time.monotonic() + timeout
+    total = sum(fake.calls.values())
+    while time.monotonic() < deadline:
+        await asyncio.sleep(quiet)
+        current = sum(fake.calls.values())
+        if current == total:
+            return
+        total = current
+
+
+async def replay(fake, interactions, rate, seed):
+    """Dispatch the interactions (at `rate` per second, all at once if 0) and wait for the answers"""
+    chooser = random.Random(seed)
+    guild_ids = list(fake.guilds)
+    records = []
+    start = time.monotonic()
+    for index in range(interactions):
+        if rate:
+            delay = start + index / rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        records.append(await fake.dispatch_interaction(chooser.choice(guild_ids), chooser.choice(COMMANDS)))
+    # Unanswered interactions are given up a little after their deadline
+    remaining = [record.done.wait() for record in records if not record.done.is_set()]
+    if remaining:
+        await asyncio.wait([asyncio.ensure_future(waiter) for waiter in remaining], timeout=INTERACTION_DEADLINE + 2)
+    return records, start
+
+
+def report(fake, records, start, calls_before, limited_before):
+    latencies = sorted(record.latency for record in records if record.latency is not None)
+    answered = [record for record in records if record.answered is not None]
+    end = max((record.answered for record in answered), default=start)
+    calls = {route: count - calls_before.get(route, 0) for route, count in fake.calls.items()}
+    calls = {route: count for route, count in sorted(calls.items()) if count}
+    limited = {route: count - limited_before.get(route, 0) for route, count in fake.rate_limited.items()}
+    total_calls = sum(calls.values())
+    return {
+        'interactions': len(records),
+        'answered': len(answered),
+        'throughput_per_sec': len(answered) / (end - start) if end > start else 0.0,
+        'latency_ms': {
+            'mean': statistics.fmean(latencies) * 1e3 if latencies else 0.0,
+            'p50': percentile(latencies, 0.50) * 1e3,
+            'p90': percentile(latencies, 0.90) * 1e3,
+            'p99': percentile(latencies, 0.99) * 1e3,
+            'p999': percentile(latencies, 0.999) * 1e3,
+            'max': latencies[-1] * 1e3 if latencies else 0.0,
+        },
+        'missed_deadlines': len(records) - len(answered),
+        'deferred': sum(1 for record in answered if record.response_type == 5),
+        'followups': sum(record.followups for record in records),
+        'rest_calls': total_calls,
+        'rest_calls_per_interaction': total_calls / len(records) if records else 0.0,
+        'rest_calls_by_route': {route: count / len(records) for route, count in calls.items()},
+        'rate_limited': {route: count for route, count in sorted(limited.items()) if count},
+        'dm_outcomes': dict(fake.dm_outcomes),
+        'unknown_routes': dict(fake.unknown_routes),
+    }
+
+
+def print_report(result):
+    latency = result['latency_ms']
+    print(f"interactions        {result['interactions']} ({result['answered']} answered)")
+    print(f"throughput          {result['throughput_per_sec']:.1f}/s")
+    print(f"latency (ms)        p50 {latency['p50']:.1f}  p90 {latency['p90']:.1f}  "
+          f"p99 {latency['p99']:.1f}  p99.9 {latency['p999']:.1f}  max {latency['max']:.1f}")
+    print(f"missed 3s deadline  {result['missed_deadlines']}")
+    print(f"REST calls          {result['rest_calls_per_interaction']:.2f} per interaction")
+    for route, count in result['rest_calls_by_route'].items():
+        print(f"  {route:<60} {count:.2f}")
+    if result['rate_limited']:
+        print(f"429 responses       {sum(result['rate_limited'].values())}")
+        for route, count in result['rate_limited'].items():
+            print(f"  {route:<60} {count}")
+    print(f"follow-ups          {result['followups']}")
+    print(f"DM outcomes         {result['dm_outcomes']}")
+    if result['unknown_routes']:
+        print(f"unknown routes      {result['unknown_routes']}")
+
+
+async def run(args):
+    scenario = Scenario(
+        guilds=args.guilds, targets=args.targets, dnd=args.dnd, closed_dms=args.closed_dms, missing=args.missing,
+        latency=args.latency, jitter=args.jitter, route_limit=(args.route_limit, args.route_window),
+        global_limit=args.global_limit, error_rate=args.error_rate, seed=args.seed,
+    )
+    fake = FakeDiscord(scenario)
+    # Requests cut short when the bot process is stopped are expected
+    logging.getLogger('aiohttp.server').setLevel(logging.CRITICAL)
+    await fake.start()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # The bot runs in its own working directory: configuration, cooldowns, history, sync state
+        with open(os.path.join(directory, 'config.json'), 'w') as f:
+            json.dump(fake.config(cooldown=args.cooldown), f)
+        env = dict(os.environ)
+        env.update({
+            'DISCORD_TOKEN': 'loadtest',
+            'COMMAND_SYNC': env.get('COMMAND_SYNC', 'force'),
+            'CONFIG_FILE': os.path.join(directory, 'config.json'),
+            'HISTORY_DIR': os.path.join(directory, 'history'),
+            'LOG_FILE': env.get('LOG_FILE', os.path.join(directory, 'bot.log')),
+            'LOG_LEVEL': env.get('LOG_LEVEL', 'WARNING'),
+        })
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--bot-process', fake.base_url],
+            cwd=directory, env=env, stdout=subprocess.PIPE, text=True
+        )
+        try:
+            await wait_ready(process, args.startup_timeout)
+            calls_before, limited_before = dict(fake.calls), dict(fake.rate_limited)
+            records, start = await replay(fake, args.interactions, args.rate, args.seed)
+            # Long enough for a request held back by a rate limit to be retried
+            await settle(fake, quiet=args.route_window + 1)
+            result = report(fake, records, start, calls_before, limited_before)
+        finally:
+            process.send_signal(signal.SIGINT)
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            await fake.stop()
+            if args.keep_log and os.path.exists(env['LOG_FILE']):
+                with open(env['LOG_FILE']) as f:
+                    sys.stderr.write(f.read())
+
+    result['params'] = {
+        key: value for key, value in vars(args).items() if key not in ('output', 'bot_process', 'keep_log')
+    }
+    result['env'] = {
+        key: os.environ[key] for key in ('SHARD_COUNT', 'LEAN_INTENTS', 'DM_WORKERS', 'CONFIG_BACKEND')
+        if key in os.environ
+    }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--guilds', type=int, default=500)
+    parser.add_argument('--targets', type=int, default=1, help='targets per server')
+    parser.add_argument('--interactions', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=500, help='interactions per second (0 = all at once)')
+    parser.add_argument('--cooldown', type=int, default=0, help='server cooldown (in seconds)')
+    parser.add_argument('--latency', type=float, default=0.05, help='median REST latency (in seconds)')
+    parser.add_argument('--jitter', type=float, default=0.5, help='lognormal spread of the latency')
+    parser.add_argument('--route-limit', type=int, default=5, help='requests per route bucket and window')
+    parser.add_argument('--route-window', type=float, default=5.0, help='route bucket window (in seconds)')
+    parser.add_argument('--global-limit', type=int, default=50, help='requests per second over every route')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 429')
+    parser.add_argument('--dnd', type=float, default=0.1, help='fraction of targets in Do Not Disturb mode')
+    parser.add_argument('--closed-dms', type=float, default=0.1, help='fraction of targets refusing DMs')
+    parser.add_argument('--missing', type=float, default=0.0, help='fraction of targets gone from the server')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--startup-timeout', type=float, default=120)
+    parser.add_argument('--keep-log', action='store_true', help="print the bot's log after the run")
+    parser.add_argument('--output', help='write the report as JSON')
+    parser.add_argument('--bot-process', metavar='URL', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.bot_process:
+        run_bot(args.bot_process)
+        return
+
+    result = asyncio.run(run(args))
+    result['python'] = platform.python_version()
+    print_report(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
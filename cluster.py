@@ -0,0 +1,182 @@
+"""
+Cluster launcher for GlouGlouBot
+Runs the bot's shards in several worker processes sharing their state
+(cooldowns, configuration, DM rate limit) through a local coordinator
+
+Usage:
+    python cluster.py --workers 4
+    python cluster.py --workers 4 --shards 16
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import time
+import urllib.request
+
+from dotenv import load_dotenv
+
+from coordinator import COORDINATOR_ADDRESS, Coordinator
+from logs import setup_logging
+
+log = logging.getLogger('glouglou.cluster')
+
+# Delay before restarting a worker that exited, doubled on every quick failure
+RESTART_DELAY = 5
+MAX_RESTART_DELAY = 300
+# A worker that ran this long (in seconds) is considered healthy again
+HEALTHY_UPTIME = 600
+
+
+def recommended_shards(token):
+    """Shard count recommended by Discord for this bot"""
+    request = urllib.request.Request(
+        'https://discord.com/api/v10/gateway/bot',
+        headers={'Authorization': f'Bot {token}', 'User-Agent': 'GlouGlouBot cluster launcher'}
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)['shards']
+
+
+def split_shards(shard_count, workers):
+    """Contiguous range of shard IDs for each worker"""
+    workers = max(1, min(workers, shard_count))
+    size, extra = divmod(shard_count, workers)
+    ranges = []
+    first = 0
+    for index in range(workers):
+        last = first + size + (1 if index < extra else 0)
+        ranges.append(list(range(first, last)))
+        first = last
+    return ranges
+
+
+def run_worker(shard_ids, shard_count, address, command_sync):
+    """Worker process entry point: run the bot for a range of shards"""
+    os.environ['COMMAND_SYNC'] = command_sync
+    os.environ['SHARDED'] = '1'
+    os.environ['SHARD_COUNT'] = str(shard_count)
+    os.environ['SHARD_IDS'] = ','.join(str(shard_id) for shard_id in shard_ids)
+    os.environ['COORDINATOR_ADDRESS'] = address
+    # Each worker keeps the ping history of its own servers
+    history_dir = os.getenv('HISTORY_DIR', 'history')
+    os.environ['HISTORY_DIR'] = os.path.join(history_dir, f"shards-{shard_ids[0]}-{shard_ids[-1]}")
+    # Imported here so the environment above is in place when the bot is built
+    import app
+    listener = setup_logging()
+    try:
+        app.bot.run(os.getenv('DISCORD_TOKEN'), log_handler=None)
+    finally:
+        listener.stop()
+
+
+class Worker:
+    """A worker process and its restart state"""
+
+    def __init__(self, shard_ids, command_sync='off'):
+        self.shard_ids = shard_ids
+        self.command_sync = command_sync
+        self.process = None
+        self.started = 0.0
+        self.delay = RESTART_DELAY
+        self.restart_at = 0.0
+
+    def start(self, context, shard_count, address):
+        self.process = context.Process(
+            target=run_worker, args=(self.shard_ids, shard_count, address, self.command_sync),
+            name=f"glouglou-shards-{self.shard_ids[0]}-{self.shard_ids[-1]}"
+        )
+        self.process.start()
+        self.started = time.monotonic()
+        log.info('Worker started', extra={'pid': self.process.pid, 'shards': f"{self.shard_ids[0]}-{self.shard_ids[-1]}"})
+
+
+async def supervise(workers, shard_count, address):
+    """Run the coordinator and keep the workers alive until interrupted"""
+    coordinator = Coordinator()
+    await coordinator.start(address)
+    log.info('Coordinator listening', extra={'address': address})
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except NotImplementedError:
+            pass
+
+    context = multiprocessing.get_context('spawn')
+    for worker in workers:
+        worker.start(context, shard_count, address)
+
+    try:
+        while not stopping.is_set():
+            try:
+                await asyncio.wait_for(stopping.wait(), 1)
+            except asyncio.TimeoutError:
+                pass
+            now = time.monotonic()
+            for worker in workers:
+                if worker.process.is_alive():
+                    continue
+                if not worker.restart_at:
+                    # Back off if the worker keeps dying soon after starting
+                    if now - worker.started >= HEALTHY_UPTIME:
+                        worker.delay = RESTART_DELAY
+                    log.warning('Worker exited', extra={
+                        'pid': worker.process.pid, 'exit_code': worker.process.exitcode, 'restart_in': worker.delay
+                    })
+                    worker.restart_at = now + worker.delay
+                    worker.delay = min(worker.delay * 2, MAX_RESTART_DELAY)
+                elif now >= worker.restart_at:
+                    worker.restart_at = 0.0
+                    # Only force the command sync on the first start
+                    if worker.command_sync == 'force':
+                        worker.command_sync = 'auto'
+                    worker.start(context, shard_count, address)
+    finally:
+        # SIGINT lets discord.py close cleanly (pending configuration writes included)
+        for worker in workers:
+            if worker.process.is_alive():
+                os.kill(worker.process.pid, signal.SIGINT)
+        for worker in workers:
+            await asyncio.to_thread(worker.process.join, 30)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        await coordinator.stop()
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes')
+    parser.add_argument('--shards', type=int, help='total shard count (default: recommended by Discord)')
+    parser.add_argument('--address', default=os.getenv('COORDINATOR_ADDRESS', COORDINATOR_ADDRESS),
+                        help='coordinator address (host:port)')
+    parser.add_argument('--force-sync', action='store_true',
+                        help='sync the slash commands even if they did not change')
+    args = parser.parse_args()
+
+    token = os.getenv('DISCORD_TOKEN')
+    if not token:
+        print("❌ ERROR: Discord token is not defined in the .env file")
+        exit(1)
+
+    shard_count = args.shards or recommended_shards(token)
+    workers = [Worker(shard_ids) for shard_ids in split_shards(shard_count, args.workers)]
+    # The command tree is global: the first worker syncs it for everyone
+    workers[0].command_sync = 'force' if args.force_sync else os.getenv('COMMAND_SYNC', 'auto')
+    listener = setup_logging()
+    try:
+        log.info('Starting cluster', extra={'shards': shard_count, 'workers': len(workers)})
+        asyncio.run(supervise(workers, shard_count, args.address))
+    finally:
+        listener.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Slash command sync for GlouGlouBot
+Only pushes the command tree to Discord when it changed since the last sync
+
+Global syncs are heavily rate-limited, so the payload the bot would send
+is hashed and the hash of the last successful sync is kept on disk.
+"""
+
+import hashlib
+import json
+import os
+
+# File keeping the hash of the last synced command tree
+SYNC_STATE_FILE = 'command_tree.json'
+
+
+async def tree_payload(tree):
+    """Global command payloads exactly as CommandTree.sync() sends them"""
+    commands = tree.get_commands()
+    if tree.translator:
+        # Localizations come from the translator
+        return [await command.get_translated_payload(tree.translator) for command in commands]
+    return [command.to_dict() for command in commands]
+
+
+async def tree_hash(tree):
+    """Stable hash of the command tree (names, descriptions, options, localizations)"""
+    payload = sorted(await tree_payload(tree), key=lambda command: (command.get('type', 1), command['name']))
+    data = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def load_synced_hash(application_id, path=SYNC_STATE_FILE):
+    """Hash of the last tree synced for this application, or None"""
+    try:
+        with open(path, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state.get(str(application_id))
+
+
+def save_synced_hash(application_id, digest, path=SYNC_STATE_FILE):
+    """Remember the tree synced for this application (atomic rename)"""
+    try:
+        with open(path, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    state[str(application_id)] = digest
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+async def sync_if_changed(tree, application_id, force=False, path=SYNC_STATE_FILE):
+    """
+    Sync the global commands if the tree changed (or force is set)
+    Returns the synced commands, or None when the sync was skipped
+    """
+    digest = await tree_hash(tree)
+    if not force and load_synced_hash(application_id, path) == digest:
+        return None
+    synced = await tree.sync()
+    save_synced_hash(application_id, digest, path)
+    return synced
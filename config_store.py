@@ -0,0 +1,486 @@
+"""
+Guild settings store for GlouGlouBot
+Keeps the server configuration in memory and writes changes through to disk
+
+Two storage backends are available, selected with the CONFIG_BACKEND
+environment variable:
+- json (default): the whole configuration in config.json
+- sqlite: one row per server in config.db (CONFIG_DB), migrated from
+  config.json on first start
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import CONFIG_READS, CONFIG_WRITES
+
+log = logging.getLogger('glouglou.config')
+
+# Configuration file to store settings per server
+CONFIG_FILE = 'config.json'
+
+# SQLite database used by the sqlite backend
+CONFIG_DB = 'config.db'
+
+# Delay (in seconds) between two checks for external changes (by the background thread)
+MTIME_CHECK_INTERVAL = 1.0
+
+
+def normalize_guild_config(guild_config):
+    """
+    Convert older entry formats to the current one
+    - just the target ID            -> {'target_users': [ID]}
+    - {'target_user': ID, ...}      -> {'target_users': [ID], ...}
+    """
+    if not isinstance(guild_config, dict):
+        guild_config = {'target_user': guild_config}
+    if 'target_user' in guild_config:
+        guild_config = dict(guild_config)
+        target = guild_config.pop('target_user')
+        guild_config.setdefault('target_users', [target] if target else [])
+    return guild_config
+
+
+# Expected type of the known settings (other settings are kept as they are)
+SETTING_TYPES = {
+    'target_users': list,
+    'cooldown': int,
+    'user_cooldown': int,
+    'channel_cooldown': int,
+    'language': str,
+    'dm_channels': dict,
+}
+
+
+def validate_config(config):
+    """Raise ValueError if a (normalized) configuration cannot be used"""
+    errors = []
+    for guild_key, guild_config in config.items():
+        if not str(guild_key).isdigit():
+            errors.append(f"{guild_key}: not a server ID")
+            continue
+        if not isinstance(guild_config, dict):
+            errors.append(f"{guild_key}: settings must be an object")
+            continue
+        for key, expected in SETTING_TYPES.items():
+            value = guild_config.get(key)
+            if value is None:
+                continue
+            if not isinstance(value, expected) or isinstance(value, bool):
+                errors.append(f"{guild_key}.{key}: expected {expected.__name__}")
+            elif key == 'target_users' and not all(isinstance(user_id, int) for user_id in value):
+                errors.append(f"{guild_key}.{key}: user IDs must be integers")
+            elif key == 'dm_channels' and not all(isinstance(channel_id, int) for channel_id in value.values()):
+                errors.append(f"{guild_key}.{key}: channel IDs must be integers")
+            elif expected is int and not 0 <= value <= 86400:
+                errors.append(f"{guild_key}.{key}: must be between 0 and 86400")
+    if errors:
+        raise ValueError("Invalid configuration: " + "; ".join(errors[:10]))
+
+
+class JsonBackend:
+    """Stores the whole configuration in a single JSON file"""
+
+    # The file is always rewritten as a whole, so writes need a full snapshot
+    whole_file = True
+
+    def __init__(self, path=CONFIG_FILE):
+        self.path = path
+
+    def version(self):
+        """Return a token that changes whenever the file is modified"""
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def load(self):
+        """Read the whole configuration"""
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def write(self, changes, config):
+        """Write the configuration atomically (temporary file + rename)"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(config, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        pass
+
+
+class SqliteBackend:
+    """Stores one row per server in a SQLite database"""
+
+    whole_file = False
+
+    def __init__(self, path=CONFIG_DB, legacy_json=CONFIG_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS guilds (guild_id TEXT PRIMARY KEY, settings TEXT NOT NULL)'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)'
+        )
+        if legacy_json:
+            self._migrate(legacy_json)
+
+    def _migrate(self, json_path):
+        """Import an existing config.json once (old bare-ID entries included)"""
+        with self._lock:
+            done = self._conn.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone()
+            if done or not os.path.exists(json_path):
+                return
+            with open(json_path, 'r') as f:
+                config = json.load(f)
+            rows = [
+                (guild_key, json.dumps(normalize_guild_config(guild_config)))
+                for guild_key, guild_config in config.items()
+            ]
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO guilds (guild_id, settings) VALUES (?, ?)', rows
+                )
+                self._conn.execute("INSERT INTO meta (key, value) VALUES ('migrated', ?)", (json_path,))
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            log.info('Configuration migrated', extra={'servers': len(rows), 'source': json_path, 'destination': self.path})
+
+    def version(self):
+        """Return a token that changes whenever another connection commits"""
+        with self._lock:
+            return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def load(self):
+        """Read the whole configuration"""
+        with self._lock:
+            rows = self._conn.execute('SELECT guild_id, settings FROM guilds').fetchall()
+        return {guild_key: json.loads(data) for guild_key, data in rows}
+
+    def write(self, changes, config=None):
+        """Upsert (or delete) only the servers that changed, in one transaction"""
+        upserts = [(k, json.dumps(v)) for k, v in changes.items() if v is not None]
+        deletes = [(k,) for k, v in changes.items() if v is None]
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                if upserts:
+                    self._conn.executemany(
+                        'INSERT OR REPLACE INTO guilds (guild_id, settings) VALUES (?, ?)', upserts
+                    )
+                if deletes:
+                    self._conn.executemany('DELETE FROM guilds WHERE guild_id = ?', deletes)
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_backend():
+    """Create the storage backend selected by the environment"""
+    kind = os.getenv('CONFIG_BACKEND', 'json').lower()
+    if kind == 'sqlite':
+        return SqliteBackend(os.getenv('CONFIG_DB', CONFIG_DB), os.getenv('CONFIG_FILE', CONFIG_FILE))
+    if kind == 'json':
+        return JsonBackend(os.getenv('CONFIG_FILE', CONFIG_FILE))
+    raise ValueError(f"Unknown CONFIG_BACKEND: {kind}")
+
+
+class ConfigStore:
+    """
+    Process-wide cache of the server configuration
+
+    The backend is read once (warm(), off the event loop), lookups are served
+    from memory and the setters update memory immediately. A background
+    thread writes the changes and picks up external edits by comparing the
+    backend version every check interval, so the event loop never touches
+    the backend.
+    Older entry formats are converted when loaded and written back with the
+    next change to that server.
+    on_change is called with {guild_key: settings or None} whenever external
+    changes are applied (file watcher or background check), from their thread.
+    """
+
+    def __init__(self, backend=None, check_interval=MTIME_CHECK_INTERVAL, on_change=None):
+        self.backend = backend
+        self.check_interval = check_interval
+        self.on_change = on_change
+        self._config = None
+        self._version = None
+        self._lock = threading.RLock()
+        # Pending writes: {guild_key: settings or None when deleted}
+        self._pending = {}
+        # Changes being written by the background thread
+        self._writing = {}
+        self._wakeup = threading.Condition(self._lock)
+        self._writer = None
+        self._closed = False
+        # Changes applied before the configuration was loaded: [(changes, persist)]
+        self._early = []
+
+    def _fresh(self):
+        """Return the in-memory configuration, loading it first if called outside the event loop"""
+        config = self._config
+        if config is not None:
+            return config
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            # Reading the backend here would block the loop (or deadlock on the coordinator)
+            raise RuntimeError('Configuration not loaded yet: await asyncio.to_thread(settings.warm) first')
+        self.warm()
+        return self._config
+
+    def _start(self):
+        """Start the background thread (called with the lock held)"""
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name='config-writer', daemon=True)
+            self._writer.start()
+
+    def _schedule(self, guild_key):
+        """Queue a server for the background writer (called with the lock held)"""
+        guild_config = self._config.get(guild_key)
+        self._pending[guild_key] = None if guild_config is None else dict(guild_config)
+        self._start()
+        self._wakeup.notify()
+
+    def _check_external(self):
+        """Reload the configuration if the backend was changed by someone else"""
+        try:
+            if not self._pending and self.backend.version() != self._version:
+                self.reload()
+        except Exception as e:
+            log.error('Configuration check failed', extra={'error': str(e)})
+
+    def _write_loop(self):
+        """Background thread: write pending changes (coalescing bursts) and pick up external changes"""
+        next_check = time.monotonic() + self.check_interval
+        while True:
+            with self._lock:
+                if not self._pending and not self._closed:
+                    self._wakeup.wait(max(0.0, next_check - time.monotonic()))
+                if not self._pending and self._closed:
+                    return
+                changes = self._pending
+                snapshot = None
+                if changes:
+                    self._writing = changes
+                    self._pending = {}
+                    if self.backend.whole_file:
+                        # Server entries are replaced, never modified (see set()): a shallow
+                        # copy is a consistent snapshot, serialized by the backend without the lock
+                        snapshot = dict(self._config)
+            if time.monotonic() >= next_check:
+                if self._config is not None:
+                    self._check_external()
+                next_check = time.monotonic() + self.check_interval
+            if not changes:
+                continue
+            try:
+                self.backend.write(changes, snapshot)
+                CONFIG_WRITES.inc()
+            except Exception as e:
+                log.error('Configuration write failed', extra={'error': str(e), 'servers': len(changes)})
+                with self._lock:
+                    self._writing = {}
+                    # Retry later, without overwriting newer values
+                    for guild_key, value in changes.items():
+                        self._pending.setdefault(guild_key, value)
+                    if self._closed:
+                        return
+                time.sleep(1)
+                continue
+            with self._lock:
+                self._writing = {}
+                self._version = self.backend.version()
+
+    def reload(self):
+        """
+        Apply external changes to the backend, replacing only the servers whose settings differ
+        The new configuration is validated first; if it is invalid the current one is kept.
+        Returns the applied changes: {guild_key: settings or None when deleted}
+        """
+        if self.backend is None or self._config is None:
+            return {}
+        current = self._version
+        version = self.backend.version()
+        if version == current:
+            return {}
+        try:
+            loaded = {k: normalize_guild_config(v) for k, v in self.backend.load().items()}
+            CONFIG_READS.inc()
+            validate_config(loaded)
+        except (OSError, ValueError, AttributeError, sqlite3.Error) as e:
+            # Keep serving the last good configuration (file being edited by hand?)
+            log.error('Configuration reload rejected', extra={'error': str(e)})
+            with self._lock:
+                self._version = version
+            return {}
+        with self._lock:
+            if self._version != current:
+                # The background writer replaced the file meanwhile: start over
+                return self.reload()
+            changes = {}
+            for guild_key in self._config.keys() | loaded.keys():
+                # Local changes not written yet take precedence
+                if guild_key in self._pending or guild_key in self._writing:
+                    continue
+                guild_config = loaded.get(guild_key)
+                if self._config.get(guild_key) != guild_config:
+                    changes[guild_key] = guild_config
+            for guild_key, guild_config in changes.items():
+                if guild_config is None:
+                    self._config.pop(guild_key, None)
+                else:
+                    self._config[guild_key] = guild_config
+            self._version = version
+        if changes:
+            log.info('Configuration reloaded', extra={'servers': len(changes)})
+            if self.on_change is not None:
+                self.on_change(changes)
+        return changes
+
+    def watch(self, watcher):
+        """
+        Reload as soon as the configuration file changes (file-based backends only)
+        Returns False if there is no file to watch (changes are then found by the background check).
+        """
+        with self._lock:
+            if self.backend is None:
+                self.backend = open_backend()
+        path = getattr(self.backend, 'path', None)
+        if path is None or not self.backend.whole_file:
+            return False
+        watcher.watch(path, lambda _: self.reload())
+        return True
+
+    def use(self, backend):
+        """Switch to another backend, writing pending changes to the current one first"""
+        self.close()
+        with self._lock:
+            self.backend = backend
+            self._config = None
+            self._version = None
+            self._early = []
+
+    def warm(self):
+        """
+        Load the configuration (off the event loop, before the first lookup made on it)
+        The backend is read without holding the lock: apply() may run meanwhile (and
+        the coordinator backend needs the event loop to answer), its changes are
+        merged once the configuration is loaded.
+        """
+        with self._lock:
+            if self.backend is None:
+                self.backend = open_backend()
+            backend = self.backend
+            loaded = self._config is not None
+        if not loaded:
+            version = backend.version()
+            config = {k: normalize_guild_config(v) for k, v in backend.load().items()}
+            CONFIG_READS.inc()
+            with self._lock:
+                if self._config is None and self.backend is backend:
+                    self._config = config
+                    self._version = version
+                    early, self._early = self._early, []
+                    for changes, persist in early:
+                        self.apply(changes, persist)
+        with self._lock:
+            self._start()
+
+    def get(self, guild_id, key, default=None):
+        """Get a setting for a server"""
+        guild_config = self._fresh().get(str(guild_id))
+        if guild_config is None:
+            return default
+        return guild_config.get(key, default)
+
+    def set(self, guild_id, key, value):
+        """Set a setting for a server; it is written to disk in the background"""
+        with self._lock:
+            config = self._fresh()
+            guild_key = str(guild_id)
+            # Copy on write: snapshots taken by the background writer share the server entries
+            config[guild_key] = {**config.get(guild_key, {}), key: value}
+            self._schedule(guild_key)
+
+    def apply(self, changes, persist=False):
+        """
+        Merge whole-server changes made elsewhere: {guild_key: settings or None when deleted}
+        With persist=True they are also written to the backend. Changes received
+        before the configuration is loaded are kept and merged by warm().
+        """
+        with self._lock:
+            config = self._config
+            if config is None:
+                self._early.append((changes, persist))
+                return
+            for guild_key, guild_config in changes.items():
+                if guild_config is None:
+                    config.pop(guild_key, None)
+                else:
+                    config[guild_key] = normalize_guild_config(guild_config)
+                if persist:
+                    self._schedule(guild_key)
+
+    def load(self):
+        """Return a copy of the whole configuration"""
+        with self._lock:
+            config = dict(self._fresh())
+        return json.loads(json.dumps(config))
+
+    def save(self, config):
+        """Replace the whole configuration"""
+        config = {k: normalize_guild_config(v) for k, v in json.loads(json.dumps(config)).items()}
+        with self._lock:
+            old_keys = set(self._fresh())
+            self._config = config
+            for guild_key in old_keys | set(self._config):
+                self._schedule(guild_key)
+
+    def flush(self):
+        """Block until every pending change has been written"""
+        with self._lock:
+            writer = self._writer
+            self._closed = True
+            self._wakeup.notify()
+        if writer is not None:
+            writer.join()
+        with self._lock:
+            self._writer = None
+            self._closed = False
+
+    def close(self):
+        """Write pending changes and release the backend"""
+        self.flush()
+        if self.backend is not None:
+            self.backend.close()
+
+
+# Shared store used by the bot and the translation helpers
+# (the backend is opened on first use, after the .env file has been loaded)
+settings = ConfigStore()
@@ -0,0 +1,286 @@
+"""
+Cooldown engine for GlouGlouBot
+Tracks when each server, member or channel may use the notification command again
+
+Keys are strings starting with the server ID ("<guild>", "<guild>:u:<user>",
+"<guild>:c:<channel>"), so the sharded engine can route them to the
+partition of the shard handling that server.
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from sharding import ShardPartitioned, shard_for
+
+log = logging.getLogger('glouglou.cooldowns')
+
+# File used to keep cooldowns across restarts
+COOLDOWN_FILE = 'cooldowns.json'
+
+
+class _Persistent:
+    """Saving and loading for engines providing snapshot(), restore() and dirty"""
+
+    def save(self, path=COOLDOWN_FILE):
+        """Write the running cooldowns to disk if they changed (atomic rename)"""
+        if not self.dirty:
+            return False
+        data = self.snapshot()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+        return True
+
+    def load(self, path=COOLDOWN_FILE):
+        """Restore cooldowns saved by a previous run"""
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r') as f:
+                self.restore(json.load(f))
+        except (OSError, ValueError) as e:
+            log.error('Cooldown load failed', extra={'error': str(e), 'path': path})
+
+
+class CooldownEngine(_Persistent):
+    """
+    Cooldown tracker based on the monotonic clock
+
+    Keys are bucketed by the second their cooldown ends in (a sparse timing
+    wheel with one-second ticks). Claiming and releasing are O(1), and every
+    elapsed tick drops its whole bucket, so expiry costs amortised O(1) per
+    key and memory only holds keys whose cooldown is still running.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        # key -> monotonic deadline after which it may be used again
+        self._deadlines = {}
+        # tick (second) -> keys whose deadline falls within it
+        self._buckets = {}
+        # Next tick to expire
+        self._cursor = None
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def _evict(self, now):
+        """Drop the buckets of every elapsed tick (called with the lock held)"""
+        current = math.floor(now)
+        if self._cursor is None:
+            self._cursor = current
+        if current < self._cursor:
+            return
+        # After a long idle period, visit the (fewer) non-empty buckets instead of every tick
+        if current - self._cursor + 1 > len(self._buckets):
+            ticks = [tick for tick in self._buckets if tick <= current]
+        else:
+            ticks = range(self._cursor, current + 1)
+        for tick in ticks:
+            keys = self._buckets.pop(tick, None)
+            if keys:
+                for key in keys:
+                    del self._deadlines[key]
+                self._dirty = True
+        self._cursor = current + 1
+
+    def _remaining(self, key, now):
+        """Seconds left on a key, or None if it may be used (called with the lock held)"""
+        deadline = self._deadlines.get(key)
+        if deadline is None:
+            return None
+        if deadline <= now:
+            # Expired within the current tick
+            self._remove(key)
+            return None
+        return max(1, int(deadline - now))
+
+    def _insert(self, key, deadline):
+        self._remove(key)
+        self._deadlines[key] = deadline
+        tick = math.ceil(deadline)
+        bucket = self._buckets.get(tick)
+        if bucket is None:
+            bucket = self._buckets[tick] = set()
+        bucket.add(key)
+        self._dirty = True
+
+    def _remove(self, key):
+        deadline = self._deadlines.pop(key, None)
+        if deadline is None:
+            return False
+        tick = math.ceil(deadline)
+        bucket = self._buckets.get(tick)
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self._buckets[tick]
+        self._dirty = True
+        return True
+
+    def check(self, key):
+        """
+        Check if a key can be used
+        Returns (can_use: bool, remaining_time: int)
+        """
+        with self._lock:
+            now = self._clock()
+            self._evict(now)
+            remaining = self._remaining(key, now)
+            if remaining is None:
+                return True, 0
+            return False, remaining
+
+    def try_claim(self, key, cooldown_seconds):
+        """
+        Atomically check a key and start its cooldown if it is free
+        Returns (claimed: bool, remaining_time: int)
+        """
+        claimed, remaining, _ = self.try_claim_many([(key, cooldown_seconds)])
+        return claimed, remaining
+
+    def try_claim_many(self, claims):
+        """
+        Atomically claim several keys: all of them, or none if one is still running
+        claims: (key, cooldown_seconds) pairs
+        Returns (claimed: bool, remaining_time: int, index of the blocking claim or None)
+        """
+        with self._lock:
+            now = self._clock()
+            self._evict(now)
+            blocking = None
+            longest = 0
+            for index, (key, _) in enumerate(claims):
+                remaining = self._remaining(key, now)
+                if remaining is not None and remaining > longest:
+                    blocking, longest = index, remaining
+            if blocking is not None:
+                return False, longest, blocking
+            for key, cooldown_seconds in claims:
+                if cooldown_seconds > 0:
+                    self._insert(key, now + cooldown_seconds)
+            return True, 0, None
+
+    def release(self, key):
+        """Cancel a claim (e.g. the notification could not be delivered)"""
+        self.release_many([key])
+
+    def release_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+    def __len__(self):
+        with self._lock:
+            self._evict(self._clock())
+            return len(self._deadlines)
+
+    @property
+    def dirty(self):
+        """True if cooldowns changed since the last snapshot"""
+        return self._dirty
+
+    def snapshot(self):
+        """Return the running cooldowns as {key: wall-clock expiry}"""
+        with self._lock:
+            now = self._clock()
+            self._evict(now)
+            offset = time.time() - now
+            self._dirty = False
+            # Converted without the lock: claims are not held up by a large snapshot
+            deadlines = self._deadlines.copy()
+        return {key: deadline + offset for key, deadline in deadlines.items() if deadline > now}
+
+    def restore(self, snapshot):
+        """Load cooldowns produced by snapshot(), ignoring those already expired"""
+        with self._lock:
+            now = self._clock()
+            self._evict(now)
+            offset = time.time() - now
+            for key, expiry in snapshot.items():
+                deadline = expiry - offset
+                if deadline > now:
+                    self._insert(key, deadline)
+
+
+def cooldown_key(guild_id, scope='guild', scope_id=None):
+    """Key of a cooldown: per server, per member of a server or per channel"""
+    if scope == 'user':
+        return f"{guild_id}:u:{scope_id}"
+    if scope == 'channel':
+        return f"{guild_id}:c:{scope_id}"
+    return str(guild_id)
+
+
+def guild_of(key):
+    """Server ID a cooldown key belongs to"""
+    return int(key.split(':', 1)[0])
+
+
+class ShardedCooldowns(_Persistent):
+    """
+    Cooldown engine with one partition per shard
+
+    Same interface as CooldownEngine; each key is handled by the engine of
+    the shard its server belongs to.
+    """
+
+    def __init__(self, shard_count=1, clock=time.monotonic):
+        self._partitions = ShardPartitioned(lambda: CooldownEngine(clock), shard_count)
+
+    def _engine(self, key):
+        return self._partitions.for_guild(guild_of(key))
+
+    def check(self, key):
+        return self._engine(key).check(key)
+
+    def try_claim(self, key, cooldown_seconds):
+        return self._engine(key).try_claim(key, cooldown_seconds)
+
+    def try_claim_many(self, claims):
+        # Keys of one server share its shard, so the claim stays atomic
+        return self._engine(claims[0][0]).try_claim_many(claims)
+
+    def release(self, key):
+        self._engine(key).release(key)
+
+    def release_many(self, keys):
+        for key in keys:
+            self._engine(key).release(key)
+
+    def __len__(self):
+        return sum(len(engine) for _, engine in self._partitions.items())
+
+    @property
+    def dirty(self):
+        return any(engine.dirty for _, engine in self._partitions.items())
+
+    def snapshot(self):
+        data = {}
+        for _, engine in self._partitions.items():
+            data.update(engine.snapshot())
+        return data
+
+    def restore(self, snapshot):
+        partitions = {}
+        for key, expiry in snapshot.items():
+            shard_id = shard_for(guild_of(key), self._partitions.shard_count)
+            partitions.setdefault(shard_id, {})[key] = expiry
+        for shard_id, data in partitions.items():
+            self._partitions.for_shard(shard_id).restore(data)
+
+    def per_shard(self):
+        """Number of running cooldowns per shard"""
+        return {shard_id: len(engine) for shard_id, engine in self._partitions.items()}
+
+    def resize(self, shard_count):
+        """Re-partition running cooldowns for a new shard count"""
+        if (shard_count or 1) == self._partitions.shard_count:
+            return
+        data = self.snapshot()
+        self._partitions.resize(shard_count)
+        self.restore(data)
@@ -0,0 +1,307 @@
+"""
+Cluster coordinator for GlouGlouBot
+A small local service holding the state shared by every worker process:
+cooldowns, the DM rate-limit budget and the server configuration
+
+Workers talk to it over a TCP connection on the local machine using
+newline-delimited JSON messages:
+- requests:      {"id": 1, "op": "claim", "claims": [["123", 60], ["123:u:456", 300]]}
+- responses:     {"id": 1, "result": [true, 0, null]}  or  {"id": 1, "error": "..."}
+- notifications: {"event": "config_changed", "changes": {"123": {...}}}
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import time
+
+from config_store import ConfigStore
+from cooldowns import CooldownEngine
+from watcher import FileWatcher
+
+log = logging.getLogger('glouglou.coordinator')
+
+# Default address of the coordinator
+COORDINATOR_ADDRESS = '127.0.0.1:7700'
+
+# Private messages per second allowed across all workers, and burst size
+DM_RATE = 5.0
+DM_BURST = 10
+
+# Delay (in seconds) between two cooldown snapshots
+SNAPSHOT_INTERVAL = 30
+
+# Maximum size of one message (the full configuration can be large)
+MESSAGE_LIMIT = 256 * 1024 * 1024
+
+# How long (in seconds) a worker waits for the answer to a request
+REQUEST_TIMEOUT = 30
+
+
+def parse_address(address):
+    """Split "host:port" into (host, port)"""
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+class TokenBucket:
+    """Rate-limit budget: reserve() returns how long the caller must wait before sending"""
+
+    def __init__(self, rate=DM_RATE, burst=DM_BURST, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+
+    def reserve(self):
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        # Tokens may go negative: callers queue up behind earlier reservations
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class Coordinator:
+    """Serves the shared state to the worker processes"""
+
+    def __init__(self, settings=None, cooldowns=None, dm_rate=DM_RATE, dm_burst=DM_BURST):
+        self.settings = settings or ConfigStore()
+        self.cooldowns = cooldowns or CooldownEngine()
+        self.dm_budget = TokenBucket(dm_rate, dm_burst)
+        self._subscribers = set()
+        self._server = None
+        self._snapshot_task = None
+        self._watcher = None
+
+    async def start(self, address=COORDINATOR_ADDRESS):
+        """Load the shared state and start listening"""
+        # External edits to the configuration, however they are found (file watcher or the
+        # store's background check), are pushed to every worker
+        loop = asyncio.get_running_loop()
+        self.settings.on_change = lambda changes: loop.call_soon_threadsafe(
+            self._broadcast, {'event': 'config_changed', 'changes': changes}
+        )
+        await asyncio.to_thread(self.settings.warm)
+        await asyncio.to_thread(self.cooldowns.load)
+        host, port = parse_address(address)
+        self._server = await asyncio.start_server(self._serve, host, port, limit=MESSAGE_LIMIT)
+        self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+        # Hand edits to the configuration file are picked up right away
+        watcher = FileWatcher()
+        if self.settings.watch(watcher):
+            watcher.start()
+            self._watcher = watcher
+
+    async def stop(self):
+        """Stop listening and persist the shared state"""
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+        if self._watcher is not None:
+            await asyncio.to_thread(self._watcher.stop)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for writer in list(self._subscribers):
+            writer.close()
+        await asyncio.to_thread(self.cooldowns.save)
+        await asyncio.to_thread(self.settings.close)
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+            await asyncio.to_thread(self.cooldowns.save)
+
+    def handle(self, message, writer=None):
+        """Execute one request and return its result"""
+        op = message['op']
+        if op == 'claim':
+            return self.cooldowns.try_claim_many(message['claims'])
+        if op == 'release':
+            self.cooldowns.release_many(message['keys'])
+            return None
+        if op == 'check':
+            return self.cooldowns.check(message['key'])
+        if op == 'cooldowns':
+            return len(self.cooldowns)
+        if op == 'dm_reserve':
+            return self.dm_budget.reserve()
+        if op == 'config_load':
+            return self.settings.load()
+        if op == 'config_write':
+            changes = message['changes']
+            self.settings.apply(changes, persist=True)
+            self._broadcast({'event': 'config_changed', 'changes': changes}, exclude=writer)
+            return None
+        raise ValueError(f"Unknown operation: {op}")
+
+    def _broadcast(self, event, exclude=None):
+        data = (json.dumps(event) + '\n').encode()
+        for writer in list(self._subscribers):
+            if writer is not exclude and not writer.is_closing():
+                writer.write(data)
+
+    async def _serve(self, reader, writer):
+        self._subscribers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                try:
+                    response = {'id': message.get('id'), 'result': self.handle(message, writer)}
+                except Exception as e:
+                    response = {'id': message.get('id'), 'error': str(e)}
+                writer.write((json.dumps(response) + '\n').encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self._subscribers.discard(writer)
+            writer.close()
+
+
+class CoordinatorError(Exception):
+    """The coordinator rejected a request"""
+
+
+class CoordinatorClient:
+    """
+    Connection from a worker to the coordinator (runs on the worker's event loop)
+
+    on_config_change is called with {guild_key: settings or None} when
+    another worker changes the configuration. If the connection is lost,
+    pending and later requests fail instead of waiting forever.
+    """
+
+    def __init__(self, address=COORDINATOR_ADDRESS, on_config_change=None, timeout=REQUEST_TIMEOUT):
+        self.address = address
+        self.on_config_change = on_config_change
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._loop = None
+
+    async def connect(self, retries=50, delay=0.2):
+        """Connect, waiting for the coordinator to come up"""
+        host, port = parse_address(self.address)
+        for attempt in range(retries):
+            try:
+                self._reader, self._writer = await asyncio.open_connection(host, port, limit=MESSAGE_LIMIT)
+                break
+            except OSError:
+                if attempt + 1 == retries:
+                    raise
+                await asyncio.sleep(delay)
+        self._loop = asyncio.get_running_loop()
+        self._reader_task = asyncio.create_task(self._read_loop())
+
+    async def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+    async def _read_loop(self):
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if 'event' in message:
+                    if message['event'] == 'config_changed' and self.on_config_change is not None:
+                        try:
+                            self.on_config_change(message['changes'])
+                        except Exception as e:
+                            log.error('Configuration change not applied', extra={'error': str(e)})
+                    continue
+                future = self._pending.pop(message.get('id'), None)
+                if future is None or future.done():
+                    continue
+                if 'error' in message:
+                    future.set_exception(CoordinatorError(message['error']))
+                else:
+                    future.set_result(message.get('result'))
+        except (ConnectionError, ValueError) as e:
+            log.error('Connection to the coordinator failed', extra={'error': str(e)})
+        finally:
+            # Later requests fail right away instead of waiting for an answer that never comes
+            self._writer.close()
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('Connection to the coordinator lost'))
+            self._pending.clear()
+
+    async def request(self, op, **params):
+        """Send a request and wait for its result (asyncio.TimeoutError after `timeout` seconds)"""
+        if self._writer is None or self._writer.is_closing():
+            raise ConnectionError('Not connected to the coordinator')
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self._writer.write((json.dumps({'id': request_id, 'op': op, **params}) + '\n').encode())
+            await self._writer.drain()
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    def request_threadsafe(self, op, **params):
+        """Blocking request from a thread other than the event loop's"""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            raise RuntimeError('request_threadsafe() would block the event loop')
+        return asyncio.run_coroutine_threadsafe(self.request(op, **params), self._loop).result()
+
+    # Shared cooldowns
+    async def try_claim_many(self, claims):
+        claimed, remaining, blocking = await self.request('claim', claims=claims)
+        return claimed, remaining, blocking
+
+    async def release_many(self, keys):
+        await self.request('release', keys=keys)
+
+    # Shared DM rate-limit budget
+    async def dm_throttle(self):
+        """Wait for a slot in the cluster-wide DM budget"""
+        delay = await self.request('dm_reserve')
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class CoordinatorBackend:
+    """
+    Configuration backend reading and writing through the coordinator
+
+    Used by ConfigStore in worker processes; its methods block, so they must
+    be called from a thread (the store's writer thread, asyncio.to_thread).
+    Changes made by other workers are pushed to the store with
+    ConfigStore.apply(), so the version never changes.
+    """
+
+    whole_file = False
+
+    def __init__(self, client):
+        self.client = client
+
+    def version(self):
+        return 0
+
+    def load(self):
+        return self.client.request_threadsafe('config_load')
+
+    def write(self, changes, config=None):
+        self.client.request_threadsafe('config_write', changes=changes)
+
+    def close(self):
+        pass
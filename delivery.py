@@ -0,0 +1,307 @@
+"""
+Private message delivery for GlouGlouBot
+Notifications are queued and sent by background workers, so answering the
+interaction never waits on Discord's DM endpoints
+
+Optionally, pings to the same user are coalesced: pings arriving within a
+short window are merged into one digest message, and later pings are edited
+into it instead of sending a new message.
+"""
+
+import asyncio
+import functools
+import logging
+import random
+import time
+
+import aiohttp
+import discord
+
+from metrics import DM_DELIVERIES, STAGE_LATENCY
+
+log = logging.getLogger('glouglou.delivery')
+
+# Maximum number of notifications waiting to be sent
+QUEUE_SIZE = 1000
+
+# Number of concurrent delivery workers
+WORKERS = 4
+
+# Attempts per notification before giving up
+MAX_ATTEMPTS = 5
+
+# Base delay (in seconds) for the exponential backoff between attempts
+RETRY_DELAY = 1.0
+
+# How long (in seconds) a sent digest keeps receiving new pings by edition
+DIGEST_LINGER = 300
+
+# Maximum number of pings listed in one digest (Discord allows 25 embed fields)
+DIGEST_MAX_ENTRIES = 25
+
+
+class DeliveryJob:
+    """
+    A private message waiting to be sent
+
+    embed may be a callable, in which case it is built right before sending.
+    When message is set, that message is edited instead of sending a new one;
+    after a successful send it holds the sent message.
+
+    on_result is awaited once with the outcome ('delivered', 'forbidden' or
+    'failed') and the last error, if any.
+
+    key and entry are only used when coalescing: key identifies the recipient
+    and entry describes the ping for the digest.
+
+    channel is the recipient's DM channel when it is already known (or a
+    callable returning it or None, looked up right before sending): the
+    message is posted to it directly, without the request opening it. When a
+    channel has to be opened (none known, or the known one is gone),
+    on_channel is called with its ID so it can be remembered.
+    """
+
+    __slots__ = ('user', 'embed', 'on_result', 'message', 'key', 'entry', 'channel', 'on_channel')
+
+    def __init__(self, user, embed, on_result=None, key=None, entry=None, channel=None, on_channel=None):
+        self.user = user
+        self.embed = embed
+        self.on_result = on_result
+        self.message = None
+        self.key = key
+        self.entry = entry
+        self.channel = channel
+        self.on_channel = on_channel
+
+
+def retry_delay(error, attempt):
+    """
+    Delay before retrying a failed send, or None if the error is not retryable
+
+    429 responses wait for the Retry-After duration given by Discord; server
+    errors and network failures use exponential backoff with full jitter.
+    """
+    if isinstance(error, discord.HTTPException):
+        if error.status == 429:
+            retry_after = error.response.headers.get('Retry-After') if error.response is not None else None
+            try:
+                return float(retry_after) + random.uniform(0, RETRY_DELAY)
+            except (TypeError, ValueError):
+                pass
+        elif error.status < 500:
+            return None
+    return random.uniform(0, RETRY_DELAY * 2 ** attempt)
+
+
+class DeliveryQueue:
+    """Bounded queue of private messages drained by a pool of workers"""
+
+    def __init__(self, maxsize=QUEUE_SIZE, workers=WORKERS, max_attempts=MAX_ATTEMPTS, throttle=None):
+        self.maxsize = maxsize
+        self.workers = workers
+        self.max_attempts = max_attempts
+        # Optional coroutine function awaited before every send (shared rate-limit budget)
+        self.throttle = throttle
+        self._queue = None
+        self._tasks = []
+
+    def start(self):
+        """Start the workers (must be called from the running event loop)"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(self.maxsize)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f'dm-delivery-{i}')
+            for i in range(self.workers)
+        ]
+
+    async def stop(self, timeout=10):
+        """Give pending messages a chance to be sent, then stop the workers"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job):
+        """Queue a message without waiting; returns False if the queue is full"""
+        if self._queue is None:
+            return False
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def __len__(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                with STAGE_LATENCY.time(stage='dm_send'):
+                    outcome, error = await self._send(job)
+                DM_DELIVERIES.inc(outcome=outcome)
+                if job.on_result is not None:
+                    await job.on_result(outcome, error)
+            except Exception:
+                log.exception('DM delivery worker error')
+            finally:
+                self._queue.task_done()
+
+    async def _send(self, job):
+        """Send one message, retrying transient failures"""
+        error = None
+        for attempt in range(self.max_attempts):
+            try:
+                if self.throttle is not None:
+                    await self.throttle()
+                embed = job.embed() if callable(job.embed) else job.embed
+                if job.message is not None:
+                    await job.message.edit(embed=embed)
+                else:
+                    job.message = await self._send_private(job, embed)
+                return 'delivered', None
+            except discord.Forbidden as e:
+                # User has disabled private messages
+                return 'forbidden', e
+            except (discord.HTTPException, aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                error = e
+                delay = retry_delay(e, attempt)
+                if delay is None or attempt + 1 == self.max_attempts:
+                    break
+                await asyncio.sleep(delay)
+        return 'failed', error
+
+    async def _send_private(self, job, embed):
+        """Post to the known DM channel, or open the channel (and report it) first"""
+        channel = job.channel() if callable(job.channel) else job.channel
+        if channel is not None:
+            try:
+                return await channel.send(embed=embed)
+            except discord.NotFound:
+                # Channel deleted or ID no longer valid: open a new one
+                pass
+        # Reported even if the message is then refused (closed DMs), so it is not opened again
+        job.channel = await job.user.create_dm()
+        if job.on_channel is not None:
+            job.on_channel(job.channel.id)
+        return await job.channel.send(embed=embed)
+
+
+class _Digest:
+    """Pings to one recipient merged into a single message"""
+
+    __slots__ = ('key', 'user', 'jobs', 'built', 'reported', 'message', 'expires', 'busy')
+
+    def __init__(self, key, user):
+        self.key = key
+        self.user = user
+        self.jobs = []
+        self.built = 0       # Pings included in the last embed built
+        self.reported = 0    # Pings whose outcome has been reported
+        self.message = None  # Sent message, edited when new pings arrive
+        self.expires = 0.0
+        self.busy = False    # A send or edit is queued or in flight
+
+
+class DigestBatcher:
+    """
+    Coalesces pings to the same recipient in front of a DeliveryQueue
+
+    The first ping to a recipient opens a window; pings arriving in the window
+    are sent together as one digest built by build_digest(entries). Pings
+    arriving after the digest was sent are edited into it for DIGEST_LINGER
+    seconds. With a window of 0 every job goes straight to the queue.
+    """
+
+    def __init__(self, queue, window, build_digest, linger=DIGEST_LINGER,
+                 max_entries=DIGEST_MAX_ENTRIES, clock=time.monotonic):
+        self.queue = queue
+        self.window = window
+        self.build_digest = build_digest
+        self.linger = linger
+        self.max_entries = max_entries
+        self._clock = clock
+        self._digests = {}
+
+    def submit(self, job):
+        """Queue or coalesce a ping; returns False if it cannot be accepted"""
+        if self.window <= 0 or job.key is None:
+            return self.queue.submit(job)
+        
+        digest = self._digests.get(job.key)
+        if digest is not None and (
+            len(digest.jobs) >= self.max_entries
+            or (not digest.busy and digest.message is not None and self._clock() >= digest.expires)
+        ):
+            # Full or too old to be edited: start a new message
+            digest = None
+        if digest is None:
+            digest = _Digest(job.key, job.user)
+            self._digests[job.key] = digest
+            digest.busy = True
+            asyncio.get_running_loop().call_later(self.window, self._dispatch, digest)
+        digest.jobs.append(job)
+        if not digest.busy:
+            digest.busy = True
+            self._dispatch(digest)
+        return True
+
+    def _embed(self, digest):
+        """Build the message for every ping received so far"""
+        digest.built = len(digest.jobs)
+        if digest.built == 1:
+            first = digest.jobs[0].embed
+            return first() if callable(first) else first
+        return self.build_digest([job.entry for job in digest.jobs])
+
+    def _dispatch(self, digest):
+        """Send (or edit) the digest message through the delivery queue"""
+        first = digest.jobs[0]
+        job = DeliveryJob(
+            digest.user, functools.partial(self._embed, digest), channel=first.channel, on_channel=first.on_channel
+        )
+        job.message = digest.message
+        job.on_result = functools.partial(self._done, digest, job)
+        if not self.queue.submit(job):
+            digest.built = len(digest.jobs)
+            asyncio.get_running_loop().create_task(self._done(digest, job, 'failed', None))
+
+    async def _done(self, digest, job, outcome, error):
+        """Report the outcome to the pings covered by this send and follow up on late pings"""
+        covered = digest.jobs[digest.reported:digest.built]
+        digest.reported = digest.built
+        digest.busy = False
+        if outcome == 'delivered':
+            if digest.message is None:
+                asyncio.get_running_loop().call_later(self.linger, self._expire, digest)
+            digest.message = job.message
+            digest.expires = self._clock() + self.linger
+            if len(digest.jobs) > digest.built:
+                # Pings arrived while sending: edit them in
+                digest.busy = True
+                self._dispatch(digest)
+        else:
+            if self._digests.get(digest.key) is digest:
+                del self._digests[digest.key]
+            # Pings that arrived while the failed send was in flight get a fresh attempt
+            for late in digest.jobs[digest.built:]:
+                self.submit(late)
+        for ping in covered:
+            if ping.on_result is not None:
+                await ping.on_result(outcome, error)
+
+    def _expire(self, digest):
+        """Stop editing a digest once it has lingered long enough"""
+        remaining = digest.expires - self._clock()
+        if remaining > 0 or digest.busy:
+            asyncio.get_running_loop().call_later(max(remaining, 1), self._expire, digest)
+        elif self._digests.get(digest.key) is digest:
+            del self._digests[digest.key]
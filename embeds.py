@@ -0,0 +1,58 @@
+"""
+Notification embeds for GlouGlouBot
+The ping embed is prebuilt per server and only patched with the values that change
+
+Title, colour, field names and footer only depend on the server, its
+language and its name: they are built once into a template embed, and each
+ping copies it and fills in the author, the channel and the timestamp.
+"""
+
+from datetime import datetime
+
+import discord
+
+
+class EmbedTemplates:
+    """
+    Ping embed templates, one per server
+
+    A template is keyed on (server ID, language, server name) and rebuilt
+    when one of them changes. The language is the translator itself, which
+    is replaced when the translations are reloaded, so templates never keep
+    outdated strings. invalidate() drops the template of a server (language
+    changed, server updated).
+
+    Embed.copy() is shallow: the fields would be shared with the template,
+    so templates have none and each copy gets its own with add_field().
+    """
+
+    def __init__(self):
+        # Format: {guild_id: (translator, guild name, (template embed, *field names))}
+        self._templates = {}
+
+    def _template(self, guild_id, guild_name, t):
+        entry = self._templates.get(guild_id)
+        if entry is not None and entry[0] is t and entry[1] == guild_name:
+            return entry[2]
+        embed = discord.Embed(title=t('mention_title'), color=discord.Color.blurple())
+        embed.set_footer(text=f"{t('mention_server')}: {guild_name}")
+        template = (embed, t('mention_server'), t('mention_channel'), t('mention_by'))
+        self._templates[guild_id] = (t, guild_name, template)
+        return template
+
+    def build(self, guild_id, guild_name, t, author_name, channel_name):
+        """Ping embed of a server: a copy of its template with the author, channel and time filled in"""
+        template, server_label, channel_label, by_label = self._template(guild_id, guild_name, t)
+        embed = template.copy()
+        embed.description = t('mention_description', author=author_name)
+        embed.timestamp = datetime.now()
+        embed.add_field(name=server_label, value=guild_name, inline=True)
+        embed.add_field(name=channel_label, value=f"#{channel_name}", inline=True)
+        embed.add_field(name=by_label, value=author_name, inline=False)
+        return embed
+
+    def invalidate(self, guild_id):
+        self._templates.pop(guild_id, None)
+
+    def __len__(self):
+        return len(self._templates)
@@ -0,0 +1,276 @@
+"""
+Ping history for GlouGlouBot
+Append-only log of ping outcomes with running per-server statistics
+
+Every outcome is a fixed-size binary record appended to the current segment
+file (segment-<n>.log); segments are rotated at SEGMENT_SIZE bytes and only
+the newest MAX_SEGMENTS are kept. Per-server aggregates are updated as
+events are recorded, so reading them never scans the log. They are
+snapshotted with the log position they cover; on startup the snapshot is
+loaded and only the records written after it are replayed.
+"""
+
+import heapq
+import json
+import logging
+import os
+import struct
+import threading
+import time
+
+log = logging.getLogger('glouglou.history')
+
+# Directory holding the segments and the aggregates snapshot
+HISTORY_DIR = 'history'
+
+# Segment size (in bytes) before rotation, and number of segments kept
+SEGMENT_SIZE = 4 * 1024 * 1024
+MAX_SEGMENTS = 8
+
+# Delay (in seconds) between two writes of buffered records, and between two aggregates snapshots
+FLUSH_INTERVAL = 1.0
+SNAPSHOT_INTERVAL = 60
+
+# Per-server pingers and targets kept in the aggregates (the least active are dropped)
+MAX_TRACKED_USERS = 100
+
+# Outcome codes stored in the records
+OUTCOMES = ('success', 'dnd', 'forbidden', 'not_found', 'cooldown', 'failed')
+
+# timestamp, server ID, author ID, target ID (0 when none), outcome code
+RECORD = struct.Struct('<IQQQB')
+
+AGGREGATES_FILE = 'aggregates.json'
+
+
+def segment_name(number):
+    return f"segment-{number:06d}.log"
+
+
+def segment_number(name):
+    """Number of a segment file, or None for other files"""
+    if name.startswith('segment-') and name.endswith('.log'):
+        try:
+            return int(name[8:-4])
+        except ValueError:
+            return None
+    return None
+
+
+class GuildStats:
+    """Running counters of one server"""
+
+    __slots__ = ('outcomes', 'authors', 'targets', 'first', 'last')
+
+    def __init__(self, data=None):
+        data = data or {}
+        self.outcomes = dict(data.get('outcomes', {}))
+        self.authors = {int(k): v for k, v in data.get('authors', {}).items()}
+        self.targets = {int(k): v for k, v in data.get('targets', {}).items()}
+        self.first = data.get('first')
+        self.last = data.get('last')
+
+    def add(self, timestamp, author_id, target_id, outcome):
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        self.authors[author_id] = self.authors.get(author_id, 0) + 1
+        if target_id:
+            self.targets[target_id] = self.targets.get(target_id, 0) + 1
+        if self.first is None:
+            self.first = timestamp
+        self.last = timestamp
+
+    @property
+    def total(self):
+        return sum(self.outcomes.values())
+
+    def top_authors(self, count=3):
+        return heapq.nlargest(count, self.authors.items(), key=lambda item: item[1])
+
+    def top_targets(self, count=3):
+        return heapq.nlargest(count, self.targets.items(), key=lambda item: item[1])
+
+    def compact(self, limit=MAX_TRACKED_USERS):
+        """Keep only the `limit` most active pingers and targets"""
+        if len(self.authors) > limit:
+            self.authors = dict(self.top_authors(limit))
+        if len(self.targets) > limit:
+            self.targets = dict(self.top_targets(limit))
+
+    def to_dict(self):
+        return {
+            'outcomes': dict(self.outcomes),
+            'authors': {str(k): v for k, v in self.authors.items()},
+            'targets': {str(k): v for k, v in self.targets.items()},
+            'first': self.first,
+            'last': self.last,
+        }
+
+
+class PingHistory:
+    """
+    Append-only ping log with per-server aggregates
+
+    record() only updates memory and buffers the encoded record; a background
+    thread appends buffered records to disk and snapshots the aggregates.
+    """
+
+    def __init__(self, directory=HISTORY_DIR, segment_size=SEGMENT_SIZE, max_segments=MAX_SEGMENTS,
+                 flush_interval=FLUSH_INTERVAL, snapshot_interval=SNAPSHOT_INTERVAL, clock=time.time):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.flush_interval = flush_interval
+        self.snapshot_interval = snapshot_interval
+        self._clock = clock
+        self._stats = {}
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._segment = None
+        self._offset = 0
+        self._writer = None
+        self._closed = False
+        self._opened = False
+
+    # Loading
+
+    def _segments(self):
+        numbers = [segment_number(name) for name in os.listdir(self.directory)]
+        return sorted(number for number in numbers if number is not None)
+
+    def open(self):
+        """Load the aggregates snapshot and replay the records written after it"""
+        os.makedirs(self.directory, exist_ok=True)
+        segment, offset = 0, 0
+        path = os.path.join(self.directory, AGGREGATES_FILE)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    snapshot = json.load(f)
+                self._stats = {int(k): GuildStats(v) for k, v in snapshot['guilds'].items()}
+                segment, offset = snapshot['segment'], snapshot['offset']
+            except (OSError, ValueError, KeyError) as e:
+                log.error('Ping history snapshot unreadable, replaying the log', extra={'error': str(e)})
+                self._stats, segment, offset = {}, 0, 0
+
+        replayed = 0
+        segments = self._segments()
+        for number in segments:
+            if number < segment:
+                continue
+            with open(os.path.join(self.directory, segment_name(number)), 'rb') as f:
+                if number == segment:
+                    f.seek(offset)
+                data = f.read()
+            # Ignore a partial record left by a crash
+            usable = len(data) - len(data) % RECORD.size
+            for timestamp, guild_id, author_id, target_id, code in RECORD.iter_unpack(data[:usable]):
+                self._apply(timestamp, guild_id, author_id, target_id, OUTCOMES[code])
+                replayed += 1
+
+        self._segment = segments[-1] if segments else max(segment, 1)
+        self._offset = self._segment_size(self._segment)
+        path = os.path.join(self.directory, segment_name(self._segment))
+        if os.path.exists(path) and os.path.getsize(path) != self._offset:
+            # Drop the partial record so appends stay aligned
+            with open(path, 'r+b') as f:
+                f.truncate(self._offset)
+        self._opened = True
+        if replayed:
+            log.info('Ping history replayed', extra={'records': replayed})
+
+    def _segment_size(self, number):
+        path = os.path.join(self.directory, segment_name(number))
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        return size - size % RECORD.size
+
+    def _apply(self, timestamp, guild_id, author_id, target_id, outcome):
+        stats = self._stats.get(guild_id)
+        if stats is None:
+            stats = self._stats[guild_id] = GuildStats()
+        stats.add(timestamp, author_id, target_id, outcome)
+
+    # Recording
+
+    def record(self, guild_id, author_id, target_id, outcome):
+        """Record a ping outcome (never touches the disk)"""
+        timestamp = int(self._clock())
+        with self._lock:
+            self._apply(timestamp, guild_id, author_id, target_id or 0, outcome)
+            if not self._opened:
+                # Not persisted (open() was never called)
+                return
+            self._buffer.append(RECORD.pack(timestamp, guild_id, author_id, target_id or 0, OUTCOMES.index(outcome)))
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name='history-writer', daemon=True)
+                self._writer.start()
+
+    def stats(self, guild_id):
+        """Aggregates of a server, or None if it has no history"""
+        return self._stats.get(guild_id)
+
+    # Writing
+
+    def _write_loop(self):
+        """Background thread: append buffered records, rotate segments, snapshot aggregates"""
+        next_snapshot = time.monotonic() + self.snapshot_interval
+        dirty = False
+        while True:
+            with self._lock:
+                if not self._closed:
+                    self._wakeup.wait(self.flush_interval)
+                closed = self._closed
+                records = self._buffer
+                self._buffer = []
+                dirty = dirty or bool(records)
+                snapshot = dirty and (closed or time.monotonic() >= next_snapshot)
+                if snapshot:
+                    for stats in self._stats.values():
+                        stats.compact()
+                    # Aggregates as of the last record about to be written
+                    guilds = {str(k): v.to_dict() for k, v in self._stats.items()}
+            if records:
+                try:
+                    self._append(b''.join(records))
+                except OSError as e:
+                    log.error('Ping history write failed', extra={'error': str(e), 'records': len(records)})
+            if snapshot:
+                self._save_snapshot(guilds)
+                next_snapshot = time.monotonic() + self.snapshot_interval
+                dirty = False
+            if closed:
+                return
+
+    def _append(self, data):
+        if self._offset >= self.segment_size:
+            self._segment += 1
+            self._offset = 0
+            self._drop_old_segments()
+        with open(os.path.join(self.directory, segment_name(self._segment)), 'ab') as f:
+            f.write(data)
+        self._offset += len(data)
+
+    def _drop_old_segments(self):
+        """Retention: keep the newest max_segments segments (the aggregates keep the totals)"""
+        segments = self._segments()
+        for number in segments[:max(0, len(segments) - self.max_segments + 1)]:
+            os.remove(os.path.join(self.directory, segment_name(number)))
+
+    def _save_snapshot(self, guilds):
+        path = os.path.join(self.directory, AGGREGATES_FILE)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'segment': self._segment, 'offset': self._offset, 'guilds': guilds}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.error('Ping history snapshot failed', extra={'error': str(e)})
+
+    def close(self):
+        """Write buffered records and the aggregates snapshot"""
+        with self._lock:
+            writer = self._writer
+            self._closed = True
+            self._wakeup.notify()
+        if writer is not None:
+            writer.join()
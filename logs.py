@@ -0,0 +1,118 @@
+"""
+Structured logging for GlouGlouBot
+JSON log records written by a background thread, so logging never blocks the event loop
+
+Records are put on a bounded queue (dropped and counted when it is full)
+and written to stdout, or to LOG_FILE with size-based rotation
+(LOG_MAX_BYTES, LOG_BACKUPS). High-volume success events (e.g. every
+command that worked) are kept with probability LOG_SAMPLE_RATE.
+"""
+
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+from metrics import Counter
+
+# Records waiting for the writer thread
+LOG_QUEUE_SIZE = 10000
+
+LOGS_DROPPED = Counter(
+    'glouglou_logs_dropped_total', 'Log records dropped because the log queue was full'
+)
+
+# Attributes of every LogRecord, so the remaining ones are the caller's extra fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'sampled'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, event and the extra fields"""
+
+    def format(self, record):
+        data = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'event': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of the records logged with extra={'sampled': True}"""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if getattr(record, 'sampled', False) and self.rate < 1.0:
+            return random.random() < self.rate
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of waiting when the queue is full"""
+
+    def prepare(self, record):
+        # Only resolve what cannot cross threads safely; JSON encoding happens in the writer
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOGS_DROPPED.inc()
+
+
+def setup_logging(level=None, path=None, max_bytes=None, backups=None, sample_rate=None, queue_size=LOG_QUEUE_SIZE):
+    """
+    Route every log record (the bot's and discord.py's) through the background writer
+    Returns the QueueListener; call its stop() at exit to write the remaining records
+    """
+    level = level or os.getenv('LOG_LEVEL', 'INFO').upper()
+    path = path if path is not None else os.getenv('LOG_FILE')
+    max_bytes = max_bytes if max_bytes is not None else int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+    backups = backups if backups is not None else int(os.getenv('LOG_BACKUPS', '5'))
+    sample_rate = sample_rate if sample_rate is not None else float(os.getenv('LOG_SAMPLE_RATE', '1.0'))
+
+    if path:
+        output = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+    else:
+        output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    records = queue.Queue(queue_size)
+    handler = NonBlockingQueueHandler(records)
+    # Sampled out before being queued, so dropped success events cost nothing more
+    handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(records, output)
+    listener.start()
+    return listener
+
@@ -0,0 +1,181 @@
+"""
+Target member resolution for GlouGlouBot
+Looks members up in the gateway cache first and only falls back to the API on a miss
+
+In lean mode the bot does not cache every member: configured targets are
+requested over the gateway (with their presence) and kept in the member cache.
+"""
+
+import asyncio
+import time
+
+import discord
+
+# How long (in seconds) a member fetched over REST is reused
+MEMBER_CACHE_TTL = 60
+
+# Maximum number of REST-fetched members kept per server
+MEMBER_CACHE_SIZE = 16
+
+# Maximum number of concurrent member fetches for one ping
+FANOUT_CONCURRENCY = 5
+
+# How long (in seconds) a ping waits for a gateway member request before falling
+# back to REST, well under the 3 seconds allowed to answer the interaction
+LEAN_QUERY_TIMEOUT = 1.0
+
+# Minimum delay (in seconds) between two background gateway member requests of a
+# shard, so startup requests leave room for the ones made by pings (the gateway
+# accepts about 120 commands per minute and per shard)
+PREFETCH_INTERVAL = 1.0
+
+# Cached in place of a member for a user known not to be on the server
+_GONE = object()
+
+
+class TargetResolver:
+    """
+    Resolves target user IDs to guild members
+
+    Members present in the gateway cache (with their presence) are returned
+    directly. Misses are fetched over REST and kept in a small per-server TTL
+    cache, invalidated by member and presence events; users the API reports
+    as gone are remembered the same way. In lean mode misses are requested
+    over the gateway instead, which caches the member and its presence; when
+    the gateway does not answer in time or does not know the member, the
+    lookup falls back to REST.
+    """
+
+    def __init__(self, ttl=MEMBER_CACHE_TTL, size=MEMBER_CACHE_SIZE, clock=time.monotonic, lean=False,
+                 concurrency=FANOUT_CONCURRENCY, query_timeout=LEAN_QUERY_TIMEOUT, prefetch_interval=PREFETCH_INTERVAL):
+        self.lean = lean
+        self.ttl = ttl
+        self.size = size
+        self.concurrency = concurrency
+        self.query_timeout = query_timeout
+        self.prefetch_interval = prefetch_interval
+        self._clock = clock
+        # Format: {guild_id: {user_id: (member, expiry)}}
+        self._cache = {}
+        self._prefetch_lock = asyncio.Lock()
+
+    def cached(self, guild, user_id):
+        """Return the member without any API call, or None"""
+        member = self._lookup(guild, user_id)
+        return None if member is _GONE else member
+
+    def _lookup(self, guild, user_id):
+        """Cached member, _GONE for a user known not to be on the server, or None"""
+        member = guild.get_member(user_id)
+        if member is not None:
+            return member
+        entries = self._cache.get(guild.id)
+        if entries:
+            entry = entries.get(user_id)
+            if entry is not None:
+                if entry[1] > self._clock():
+                    return entry[0]
+                del entries[user_id]
+        return None
+
+    async def resolve(self, guild, user_id):
+        """Return the member for a user ID, or None if the user is no longer on the server"""
+        member = self._lookup(guild, user_id)
+        if member is not None:
+            return None if member is _GONE else member
+        if self.lean:
+            return (await self.resolve_many(guild, [user_id]))[user_id]
+        return await self._fetch(guild, user_id)
+
+    async def resolve_many(self, guild, user_ids):
+        """
+        Resolve several user IDs at once
+        Returns {user_id: member or None}; misses are requested concurrently,
+        at most `concurrency` at a time (in lean mode, after a single gateway
+        request, only for the members it did not return in time)
+        """
+        resolved = {user_id: self._lookup(guild, user_id) for user_id in user_ids}
+        missing = [user_id for user_id, member in resolved.items() if member is None]
+        if missing:
+            await self._resolve_missing(guild, missing, resolved)
+        return {user_id: None if member is _GONE else member for user_id, member in resolved.items()}
+
+    async def _resolve_missing(self, guild, missing, resolved):
+        """Look the missing user IDs up and fill them in `resolved`"""
+        if self.lean:
+            try:
+                found = await asyncio.wait_for(self.warm(guild, missing, strict=True), self.query_timeout)
+            except asyncio.TimeoutError:
+                found = []
+            for member in found:
+                resolved[member.id] = member
+            missing = [user_id for user_id in missing if resolved[user_id] is None]
+            if not missing:
+                return
+        
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async def fetch(user_id):
+            async with semaphore:
+                resolved[user_id] = await self._fetch(guild, user_id)
+        
+        await asyncio.gather(*(fetch(user_id) for user_id in missing))
+
+    async def warm(self, guild, user_ids, strict=False):
+        """
+        Request members and their presence over the gateway and keep them in the member cache
+        Returns the members that were not cached yet and could be found; a request
+        left unanswered returns nothing, or raises asyncio.TimeoutError if `strict`
+        """
+        missing = [user_id for user_id in user_ids if guild.get_member(user_id) is None]
+        if not missing:
+            return []
+        try:
+            return await guild.query_members(user_ids=missing, presences=True, cache=True)
+        except asyncio.TimeoutError:
+            if strict:
+                raise
+            return []
+
+    async def prefetch(self, guild, user_ids):
+        """
+        Warm the member cache in the background (e.g. when a server becomes available)
+        Requests are sent one at a time, at most one per `prefetch_interval`
+        """
+        async with self._prefetch_lock:
+            started = self._clock()
+            try:
+                await self.warm(guild, user_ids)
+            finally:
+                delay = self.prefetch_interval - (self._clock() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+    async def _fetch(self, guild, user_id):
+        """Fetch a member over REST, or None if the user is no longer on the server"""
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            self._store(guild.id, user_id, _GONE)
+            return None
+        self._store(guild.id, user_id, member)
+        return member
+
+    def _store(self, guild_id, user_id, member):
+        """Remember a REST-fetched member (or _GONE), evicting the oldest entry when full"""
+        entries = self._cache.setdefault(guild_id, {})
+        entries.pop(user_id, None)
+        if len(entries) >= self.size:
+            del entries[next(iter(entries))]
+        entries[user_id] = (member, self._clock() + self.ttl)
+
+    def invalidate(self, guild_id, user_id=None):
+        """Forget one member of a server, or the whole server"""
+        if user_id is None:
+            self._cache.pop(guild_id, None)
+            return
+        entries = self._cache.get(guild_id)
+        if entries:
+            entries.pop(user_id, None)
+            if not entries:
+                del self._cache[guild_id]
@@ -0,0 +1,269 @@
+"""
+Metrics for GlouGlouBot
+Counters, gauges and latency histograms exposed in the Prometheus text format
+
+Set METRICS_PORT to serve them on http://127.0.0.1:<port>/metrics
+(METRICS_HOST changes the listening address).
+"""
+
+import asyncio
+import bisect
+import functools
+import logging
+import threading
+import time
+
+# Per-command log records (successes are sampled, see logs.py)
+command_log = logging.getLogger('glouglou.commands')
+
+# Default latency buckets (in seconds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = list(self._values.items())
+        lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {value}' for key, value in items]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Value sampled when the metrics are rendered"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, description, labelnames=(), callback=None):
+        super().__init__(name, description, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self):
+        if self.callback is not None:
+            # callback returns a number, or {label values tuple: number}
+            values = self.callback()
+            with self._lock:
+                self._values = values if isinstance(values, dict) else {(): values}
+        return super().render()
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (cumulative buckets)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (+Inf last), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """Context manager observing the duration of its block"""
+        return _Timer(self, labels)
+
+    def _render_samples(self, items):
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+REGISTRY = []
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# Bot metrics
+COMMAND_LATENCY = Histogram(
+    'glouglou_command_duration_seconds', 'Slash command handling time', ['command']
+)
+COMMANDS = Counter(
+    'glouglou_commands_total', 'Slash commands handled', ['command', 'outcome']
+)
+STAGE_LATENCY = Histogram(
+    'glouglou_stage_duration_seconds',
+    'Time spent in each stage of a notification (cooldown, resolve, embed, response, dm_send)',
+    ['stage']
+)
+REST_REQUESTS = Counter(
+    'glouglou_rest_requests_total', 'Discord REST API requests', ['method', 'route']
+)
+REST_RATELIMITED = Counter(
+    'glouglou_rest_ratelimited_total', 'Discord REST API 429 responses'
+)
+CONFIG_READS = Counter(
+    'glouglou_config_reads_total', 'Full configuration reads from the storage backend'
+)
+CONFIG_WRITES = Counter(
+    'glouglou_config_writes_total', 'Configuration writes to the storage backend'
+)
+COOLDOWN_REJECTIONS = Counter(
+    'glouglou_cooldown_rejections_total', 'Notifications rejected because of the cooldown'
+)
+DM_DELIVERIES = Counter(
+    'glouglou_dm_deliveries_total', 'Private message delivery outcomes', ['outcome']
+)
+
+
+def track_command(command):
+    """Decorator recording the latency and outcome of a slash command callback"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = await func(*args, **kwargs)
+                outcome = 'ok'
+                return result
+            finally:
+                latency = time.perf_counter() - start
+                COMMAND_LATENCY.observe(latency, command=command)
+                COMMANDS.inc(command=command, outcome=outcome)
+                command_log.log(
+                    logging.INFO if outcome == 'ok' else logging.WARNING, 'command',
+                    extra={
+                        'command': command,
+                        'guild_id': getattr(args[0], 'guild_id', None) if args else None,
+                        'outcome': outcome,
+                        'latency_ms': round(latency * 1000, 3),
+                        'sampled': outcome == 'ok',
+                    }
+                )
+        return wrapper
+    return decorator
+
+
+class RateLimitLogHandler(logging.Handler):
+    """Counts the 429 responses that discord.py handles (and logs) internally"""
+
+    def emit(self, record):
+        if record.levelno >= logging.WARNING and '429' in str(record.msg):
+            REST_RATELIMITED.inc()
+
+
+def instrument_http(http):
+    """Count REST requests made through a discord.py HTTPClient"""
+    request = http.request
+
+    async def counted_request(route, **kwargs):
+        REST_REQUESTS.inc(method=route.method, route=route.path)
+        return await request(route, **kwargs)
+
+    http.request = counted_request
+    logging.getLogger('discord.http').addHandler(RateLimitLogHandler(logging.WARNING))
+
+
+async def _handle_client(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        # Skip headers
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+            pass
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+            body = render().encode()
+            status = '200 OK'
+        else:
+            body = b'Not Found\n'
+            status = '404 Not Found'
+        writer.write(
+            f'HTTP/1.1 {status}\r\n'
+            f'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: close\r\n\r\n'.encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(port, host='127.0.0.1'):
+    """Serve /metrics over HTTP on the running event loop"""
+    return await asyncio.start_server(_handle_client, host, port)
@@ -0,0 +1,68 @@
+"""
+Shard-aware state for GlouGlouBot
+Splits per-server state into one partition per gateway shard
+"""
+
+
+def shard_for(guild_id, shard_count):
+    """Shard that receives the events of a server (Discord's formula)"""
+    if not shard_count or shard_count <= 1:
+        return 0
+    return (int(guild_id) >> 22) % shard_count
+
+
+def parse_shard_ids(value):
+    """Parse SHARD_IDS: a comma-separated list of IDs and ranges ("0,1,4-7")"""
+    if not value:
+        return None
+    shard_ids = []
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            shard_ids.extend(range(int(first), int(last) + 1))
+        else:
+            shard_ids.append(int(part))
+    return shard_ids
+
+
+class ShardPartitioned:
+    """
+    One instance of a state object per shard, created on first use
+
+    A shard's partition can be dropped on its own (e.g. when the shard
+    re-identifies and its cached members may be stale), and locks or
+    structures inside a partition are only contended by that shard's servers.
+    """
+
+    def __init__(self, factory, shard_count=1):
+        self.factory = factory
+        self.shard_count = shard_count or 1
+        self._partitions = {}
+
+    def for_shard(self, shard_id):
+        """Return the partition of a shard"""
+        partition = self._partitions.get(shard_id)
+        if partition is None:
+            partition = self._partitions[shard_id] = self.factory()
+        return partition
+
+    def for_guild(self, guild_id):
+        """Return the partition of the shard handling a server"""
+        return self.for_shard(shard_for(guild_id, self.shard_count))
+
+    def reset(self, shard_id):
+        """Drop the state of one shard"""
+        self._partitions.pop(shard_id, None)
+
+    def items(self):
+        return list(self._partitions.items())
+
+    def resize(self, shard_count):
+        """Change the number of shards, dropping state that no longer matches"""
+        shard_count = shard_count or 1
+        if shard_count != self.shard_count:
+            self.shard_count = shard_count
+            self._partitions = {}
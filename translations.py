@@ -1,25 +1,40 @@
 """
 Translation system for GlouGlouBot
 Supports English (default) and French
+
+Strings can be overridden, and languages added, with an external JSON catalog
+(TRANSLATIONS_FILE, {language: {key: text}}), reloaded while the bot runs.
 """
 
+import json
+import os
+from string import Formatter
+
+from config_store import settings
+
 TRANSLATIONS = {
     'en': {
-        # Bot events
-        'bot_connected': '✅ Bot connected as {name} (ID: {id})',
-        'commands_synced': '✅ {count} slash command(s) synced',
-        'sync_error': '❌ Error syncing commands: {error}',
-        
         # Set target command
         'target_set': "✅ **{user}** is now set as the target for the /deepthroat command!",
+        'target_added': "✅ **{user}** will also receive /deepthroat notifications ({count} target(s)).",
+        'target_already_set': "❌ **{user}** is already a target.",
+        'targets_full': "❌ A server cannot have more than {max} targets.",
+        'target_removed': "✅ **{user}** will no longer receive /deepthroat notifications ({count} target(s) left).",
+        'target_not_in_list': "❌ **{user}** is not a target.",
         
         # Set cooldown command
         'cooldown_min_error': "❌ Cooldown must be at least 1 second.",
         'cooldown_max_error': "❌ Cooldown cannot exceed 86400 seconds (24 hours).",
         'cooldown_set': "✅ The /deepthroat command cooldown is now **{time_str}** ({seconds}s).",
+        'cooldown_user_set': "✅ Each member can now use /deepthroat once every **{time_str}** ({seconds}s).",
+        'cooldown_channel_set': "✅ /deepthroat can now be used once every **{time_str}** ({seconds}s) in each channel.",
+        'cooldown_user_disabled': "✅ The per-member cooldown is now disabled.",
+        'cooldown_channel_disabled': "✅ The per-channel cooldown is now disabled.",
         
         # View cooldown command
         'cooldown_current': "⏱️ The current cooldown for /deepthroat is **{time_str}** ({seconds}s).",
+        'cooldown_current_user': "⏱️ Each member must also wait **{time_str}** ({seconds}s) between two uses.",
+        'cooldown_current_channel': "⏱️ Each channel must also wait **{time_str}** ({seconds}s) between two uses.",
         
         # Set language command
         'language_set': "✅ Language set to **{language}** for this server!",
@@ -27,8 +42,11 @@ TRANSLATIONS = {
         
         # Main command
         'cooldown_active': "⏱️ This command is on cooldown for the server. Wait **{time_str}** more before using it again.",
+        'cooldown_active_user': "⏱️ You are on cooldown for this command. Wait **{time_str}** more before using it again.",
+        'cooldown_active_channel': "⏱️ This command is on cooldown in this channel. Wait **{time_str}** more before using it again.",
         'no_target_set': "❌ No target has been set for this server. An administrator must use `/settarget` first.",
         'target_not_found': "❌ The target user is no longer on this server. An administrator must reset the target with `/settarget`.",
+        'target_missing': "❌ {user} is no longer on this server. An administrator can remove them with `/removetarget`.",
         'mention_title': "📬 You have been mentioned!",
         'mention_description': "**{author}** pinged you via /deepthroat",
         'mention_server': "🏠 Server",
@@ -39,6 +57,20 @@ TRANSLATIONS = {
         'user_dnd': "❌ **{user}** is in Do Not Disturb mode and cannot be disturbed.",
         'general_error': "❌ An error occurred while sending the message.",
         
+        # Coalesced notifications
+        'digest_title': "📬 You have been mentioned {count} times!",
+        'digest_entry': "💬 #{channel} · 👤 {author} · <t:{timestamp}:R>",
+        
+        # Ping statistics command
+        'pingstats_title': "📊 Ping statistics since <t:{since}:D>",
+        'pingstats_empty': "📊 No ping has been recorded on this server yet.",
+        'pingstats_summary': "**{total}** ping(s), **{rate}%** delivered",
+        'pingstats_outcomes': "Outcomes",
+        'pingstats_outcomes_value': "✅ {success} delivered · 🔕 {dnd} do not disturb · 🚫 {forbidden} DMs closed\n❓ {not_found} not found · ⏱️ {cooldown} on cooldown · ⚠️ {failed} failed",
+        'pingstats_top_authors': "Top pingers",
+        'pingstats_top_targets': "Most pinged",
+        'pingstats_entry': "<@{user}> · {count}",
+        
         # Time formatting
         'seconds': "second(s)",
         'minutes': "minute(s)",
@@ -48,29 +80,38 @@ TRANSLATIONS = {
         # Command descriptions
         'cmd_settarget_desc': "Set the user who will receive notifications (Admin only)",
         'cmd_settarget_param': "The user who will receive the pings",
+        'cmd_addtarget_desc': "Add a user who will receive notifications (Admin only)",
+        'cmd_removetarget_desc': "Remove a user from the notification recipients (Admin only)",
         'cmd_setcooldown_desc': "Set the cooldown for the /deepthroat command (Admin only)",
         'cmd_setcooldown_param': "Cooldown duration in seconds (minimum: 1, maximum: 86400)",
         'cmd_viewcooldown_desc': "Display the current cooldown for the /deepthroat command",
         'cmd_setlanguage_desc': "Set the bot language for this server (Admin only)",
         'cmd_setlanguage_param': "Language (en for English, fr for French)",
         'cmd_deepthroat_desc': "Send a private notification to the target user",
+        'cmd_pingstats_desc': "Display the ping statistics of this server",
     },
     'fr': {
-        # Bot events
-        'bot_connected': '✅ Bot connecté en tant que {name} (ID: {id})',
-        'commands_synced': '✅ {count} commande(s) slash synchronisée(s)',
-        'sync_error': '❌ Erreur lors de la synchronisation des commandes: {error}',
-        
         # Set target command
         'target_set': "✅ **{user}** est maintenant défini comme cible pour la commande /gorgeprofonde !",
+        'target_added': "✅ **{user}** recevra aussi les notifications /gorgeprofonde ({count} cible(s)).",
+        'target_already_set': "❌ **{user}** est déjà une cible.",
+        'targets_full': "❌ Un serveur ne peut pas avoir plus de {max} cibles.",
+        'target_removed': "✅ **{user}** ne recevra plus les notifications /gorgeprofonde ({count} cible(s) restante(s)).",
+        'target_not_in_list': "❌ **{user}** n'est pas une cible.",
         
         # Set cooldown command
         'cooldown_min_error': "❌ Le cooldown doit être d'au moins 1 seconde.",
         'cooldown_max_error': "❌ Le cooldown ne peut pas dépasser 86400 secondes (24 heures).",
         'cooldown_set': "✅ Le cooldown de la commande /gorgeprofonde est maintenant de **{time_str}** ({seconds}s).",
+        'cooldown_user_set': "✅ Chaque membre peut maintenant utiliser /gorgeprofonde une fois toutes les **{time_str}** ({seconds}s).",
+        'cooldown_channel_set': "✅ /gorgeprofonde peut maintenant être utilisée une fois toutes les **{time_str}** ({seconds}s) dans chaque salon.",
+        'cooldown_user_disabled': "✅ Le cooldown par membre est maintenant désactivé.",
+        'cooldown_channel_disabled': "✅ Le cooldown par salon est maintenant désactivé.",
         
         # View cooldown command
         'cooldown_current': "⏱️ Le cooldown actuel pour /gorgeprofonde est de **{time_str}** ({seconds}s).",
+        'cooldown_current_user': "⏱️ Chaque membre doit aussi attendre **{time_str}** ({seconds}s) entre deux utilisations.",
+        'cooldown_current_channel': "⏱️ Chaque salon doit aussi attendre **{time_str}** ({seconds}s) entre deux utilisations.",
         
         # Set language command
         'language_set': "✅ Langue définie sur **{language}** pour ce serveur !",
@@ -78,8 +119,11 @@ TRANSLATIONS = {
         
         # Main command
         'cooldown_active': "⏱️ Cette commande est en cooldown pour le serveur. Attendez encore **{time_str}** avant de l'utiliser à nouveau.",
+        'cooldown_active_user': "⏱️ Vous êtes en cooldown pour cette commande. Attendez encore **{time_str}** avant de l'utiliser à nouveau.",
+        'cooldown_active_channel': "⏱️ Cette commande est en cooldown dans ce salon. Attendez encore **{time_str}** avant de l'utiliser à nouveau.",
         'no_target_set': "❌ Aucune cible n'a été définie pour ce serveur. Un administrateur doit utiliser `/setcible` d'abord.",
         'target_not_found': "❌ L'utilisateur cible n'est plus sur ce serveur. Un administrateur doit redéfinir la cible avec `/setcible`.",
+        'target_missing': "❌ {user} n'est plus sur ce serveur. Un administrateur peut le retirer avec `/removetarget`.",
         'mention_title': "📬 Vous avez été mentionné !",
         'mention_description': "**{author}** vous a pingé via /gorgeprofonde",
         'mention_server': "🏠 Serveur",
@@ -90,6 +134,20 @@ TRANSLATIONS = {
         'user_dnd': "❌ **{user}** est en mode Ne Pas Déranger et ne peut pas être dérangé.",
         'general_error': "❌ Une erreur s'est produite lors de l'envoi du message.",
         
+        # Coalesced notifications
+        'digest_title': "📬 Vous avez été mentionné {count} fois !",
+        'digest_entry': "💬 #{channel} · 👤 {author} · <t:{timestamp}:R>",
+        
+        # Ping statistics command
+        'pingstats_title': "📊 Statistiques des pings depuis le <t:{since}:D>",
+        'pingstats_empty': "📊 Aucun ping n'a encore été enregistré sur ce serveur.",
+        'pingstats_summary': "**{total}** ping(s), **{rate}%** délivré(s)",
+        'pingstats_outcomes': "Résultats",
+        'pingstats_outcomes_value': "✅ {success} délivré(s) · 🔕 {dnd} ne pas déranger · 🚫 {forbidden} MP fermés\n❓ {not_found} introuvable(s) · ⏱️ {cooldown} en cooldown · ⚠️ {failed} échec(s)",
+        'pingstats_top_authors': "Plus gros pingeurs",
+        'pingstats_top_targets': "Plus pingés",
+        'pingstats_entry': "<@{user}> · {count}",
+        
         # Time formatting
         'seconds': "seconde(s)",
         'minutes': "minute(s)",
@@ -99,15 +157,202 @@ TRANSLATIONS = {
         # Command descriptions
         'cmd_settarget_desc': "Définir l'utilisateur qui recevra les notifications (Admin seulement)",
         'cmd_settarget_param': "L'utilisateur qui recevra les pings",
+        'cmd_addtarget_desc': "Ajouter un utilisateur qui recevra les notifications (Admin seulement)",
+        'cmd_removetarget_desc': "Retirer un utilisateur des destinataires des notifications (Admin seulement)",
         'cmd_setcooldown_desc': "Définir le cooldown de la commande /gorgeprofonde (Admin seulement)",
         'cmd_setcooldown_param': "Durée du cooldown en secondes (minimum: 1, maximum: 86400)",
         'cmd_viewcooldown_desc': "Afficher le cooldown actuel de la commande /gorgeprofonde",
         'cmd_setlanguage_desc': "Définir la langue du bot pour ce serveur (Admin seulement)",
         'cmd_setlanguage_param': "Langue (en pour Anglais, fr pour Français)",
         'cmd_deepthroat_desc': "Envoie une notification privée à l'utilisateur cible",
+        'cmd_pingstats_desc': "Afficher les statistiques des pings de ce serveur",
     }
 }
 
+DEFAULT_LANGUAGE = 'en'
+
+# External catalog merged over TRANSLATIONS
+TRANSLATIONS_FILE = 'translations.json'
+
+
+# str.format conversions (!r, !s, !a)
+_CONVERSIONS = {'r': repr, 's': str, 'a': ascii}
+
+
+class Template:
+    """A translation string parsed once, with the placeholders it expects"""
+
+    __slots__ = ('text', 'fields', 'segments')
+
+    def __init__(self, text):
+        self.text = text
+        parsed = list(Formatter().parse(text))
+        self.fields = frozenset(field for _, field, _, _ in parsed if field is not None)
+        # Format: ((literal, field or None, conversion or None, format spec), ...)
+        # None when a placeholder is positional, an attribute or an index, or has a
+        # nested spec: those are left to str.format_map
+        self.segments = tuple(
+            (literal, field, _CONVERSIONS[conversion] if conversion else None, spec or '')
+            for literal, field, spec, conversion in parsed
+        )
+        if any(
+            field is not None and (not field.isidentifier() or '{' in spec)
+            for _, field, _, spec in self.segments
+        ):
+            self.segments = None
+
+    def render(self, kwargs):
+        """Format the template, returning the raw text if an argument is missing"""
+        if not kwargs or not self.fields:
+            return self.text
+        try:
+            if self.segments is None:
+                return self.text.format_map(kwargs)
+            parts = []
+            for literal, field, convert, spec in self.segments:
+                parts.append(literal)
+                if field is not None:
+                    value = kwargs[field]
+                    if convert is not None:
+                        value = convert(value)
+                    parts.append(format(value, spec))
+            return ''.join(parts)
+        except KeyError:
+            return self.text
+
+
+def compile_catalog(translations, previous=None):
+    """
+    Parse every translation string once and check that all languages match
+    
+    Args:
+        translations: {language: {key: text}} dictionary
+        previous: catalog whose templates are reused for unchanged strings
+        
+    Returns:
+        {language: {key: Template}} dictionary
+        
+    Raises:
+        ValueError: if a language is missing keys or uses different placeholders
+    """
+    previous = previous or {}
+    catalog = {}
+    for language, texts in translations.items():
+        old = previous.get(language, {})
+        templates = catalog[language] = {}
+        for key, text in texts.items():
+            if not isinstance(text, str):
+                raise ValueError(f"Invalid translation catalog: {language}.{key} is not a string")
+            template = old.get(key)
+            templates[key] = template if template is not None and template.text == text else Template(text)
+    
+    reference = catalog[DEFAULT_LANGUAGE]
+    errors = []
+    for language, templates in catalog.items():
+        missing = reference.keys() - templates.keys()
+        extra = templates.keys() - reference.keys()
+        if missing:
+            errors.append(f"{language}: missing keys {sorted(missing)}")
+        if extra:
+            errors.append(f"{language}: unknown keys {sorted(extra)}")
+        for key in reference.keys() & templates.keys():
+            if templates[key].fields != reference[key].fields:
+                errors.append(
+                    f"{language}.{key}: placeholders {sorted(templates[key].fields)} "
+                    f"do not match {sorted(reference[key].fields)}"
+                )
+    if errors:
+        raise ValueError("Invalid translation catalog:\n" + "\n".join(errors))
+    return catalog
+
+
+class Translator:
+    """Translation helper bound to one language"""
+
+    __slots__ = ('language', '_templates')
+
+    def __init__(self, language, templates):
+        self.language = language
+        self._templates = templates
+
+    def __call__(self, key, **kwargs):
+        """Get the formatted text for a key (the key itself if unknown)"""
+        template = self._templates.get(key)
+        if template is None:
+            return key
+        return template.render(kwargs)
+
+
+CATALOG = compile_catalog(TRANSLATIONS)
+TRANSLATORS = {language: Translator(language, templates) for language, templates in CATALOG.items()}
+
+
+def catalog_path():
+    return os.getenv('TRANSLATIONS_FILE', TRANSLATIONS_FILE)
+
+
+def reload_translations(path=None):
+    """
+    Merge the external catalog over the built-in strings, validate it, then swap it in
+    
+    Only strings whose text changed are parsed again, and translators of
+    unchanged languages are kept.
+    
+    Returns:
+        Sorted list of the (language, key) pairs that changed
+        
+    Raises:
+        ValueError: if the catalog is invalid (the current one stays in use)
+    """
+    global CATALOG, TRANSLATORS
+    path = path or catalog_path()
+    merged = {language: dict(texts) for language, texts in TRANSLATIONS.items()}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            external = json.load(f)
+        if not isinstance(external, dict) or not all(isinstance(texts, dict) for texts in external.values()):
+            raise ValueError("Invalid translation catalog: expected {language: {key: text}}")
+        for language, texts in external.items():
+            merged.setdefault(language, {}).update(texts)
+    
+    catalog = compile_catalog(merged, previous=CATALOG)
+    changed = sorted(
+        (language, key)
+        for language in catalog.keys() | CATALOG.keys()
+        for key in catalog.get(language, {}).keys() | CATALOG.get(language, {}).keys()
+        if catalog.get(language, {}).get(key) is not CATALOG.get(language, {}).get(key)
+    )
+    changed_languages = {language for language, _ in changed}
+    translators = {
+        language: TRANSLATORS[language]
+        if language in TRANSLATORS and language not in changed_languages
+        else Translator(language, templates)
+        for language, templates in catalog.items()
+    }
+    CATALOG, TRANSLATORS = catalog, translators
+    return changed
+
+
+def available_languages():
+    """Languages of the current catalog"""
+    return sorted(TRANSLATORS)
+
+
+def translator_for(guild_id):
+    """
+    Get the translator for a guild's language
+    
+    Resolve it once per interaction and reuse it for every string of the response.
+    
+    Args:
+        guild_id: Discord guild ID
+        
+    Returns:
+        Translator bound to the guild language
+    """
+    language = settings.get(guild_id, 'language', DEFAULT_LANGUAGE)
+    return TRANSLATORS.get(language, TRANSLATORS[DEFAULT_LANGUAGE])
+
 def get_text(guild_id, key, **kwargs):
     """
     Get translated text for a specific guild
@@ -120,26 +365,7 @@ def get_text(guild_id, key, **kwargs):
     Returns:
         Formatted translated text
     """
-    from app import load_config
-    
-    config = load_config()
-    guild_config = config.get(str(guild_id), {})
-    
-    if isinstance(guild_config, dict):
-        language = guild_config.get('language', 'en')
-    else:
-        language = 'en'
-    
-    # Get text from translations, fallback to English if not found
-    text = TRANSLATIONS.get(language, TRANSLATIONS['en']).get(key, TRANSLATIONS['en'].get(key, key))
-    
-    # Format with provided arguments
-    if kwargs:
-        try:
-            return text.format(**kwargs)
-        except KeyError:
-            return text
-    return text
+    return translator_for(guild_id)(key, **kwargs)
 
 def format_time(seconds, guild_id):
     """
@@ -147,24 +373,26 @@ def format_time(seconds, guild_id):
     
     Args:
         seconds: Duration in seconds
-        guild_id: Discord guild ID for language preference
+        guild_id: Discord guild ID for language preference, or a Translator
         
     Returns:
         Formatted time string
     """
+    t = guild_id if isinstance(guild_id, Translator) else translator_for(guild_id)
+    
     if seconds < 60:
-        return f"{seconds} {get_text(guild_id, 'seconds')}"
+        return f"{seconds} {t('seconds')}"
     elif seconds < 3600:
         minutes = seconds // 60
         secs = seconds % 60
-        result = f"{minutes} {get_text(guild_id, 'minutes')}"
+        result = f"{minutes} {t('minutes')}"
         if secs > 0:
-            result += f" {get_text(guild_id, 'and')} {secs} {get_text(guild_id, 'seconds')}"
+            result += f" {t('and')} {secs} {t('seconds')}"
         return result
     else:
         hours = seconds // 3600
         minutes = (seconds % 3600) // 60
-        result = f"{hours} {get_text(guild_id, 'hours')}"
+        result = f"{hours} {t('hours')}"
         if minutes > 0:
-            result += f" {get_text(guild_id, 'and')} {minutes} {get_text(guild_id, 'minutes')}"
+            result += f" {t('and')} {minutes} {t('minutes')}"
         return result
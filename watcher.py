@@ -0,0 +1,169 @@
+"""
+File watcher for GlouGlouBot
+Calls back when watched files change: inotify on Linux, mtime polling elsewhere
+
+The parent directories are watched rather than the files themselves, so
+editors and atomic writes that replace the file (write + rename) are seen.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+
+log = logging.getLogger('glouglou.watcher')
+
+# Delay (in seconds) between two checks when polling
+POLL_INTERVAL = 1.0
+
+# Events arriving within this delay (in seconds) are handled together
+DEBOUNCE = 0.05
+
+# inotify constants (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct('iIII')
+
+
+def _load_inotify():
+    """libc's inotify functions, or None where unavailable"""
+    if not hasattr(os, 'uname') or os.uname().sysname != 'Linux':
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+def _mtime(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+class FileWatcher:
+    """
+    Background thread calling callback(path) when one of the watched files changes
+
+    Callbacks run on the watcher thread; they must be thread-safe and quick
+    (hand the work over to the event loop if it needs one).
+    """
+
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._callbacks = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.mode = None
+
+    def watch(self, path, callback):
+        """Watch a file (it does not need to exist yet)"""
+        self._callbacks[os.path.abspath(path)] = callback
+
+    def start(self):
+        libc = _load_inotify()
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC) if libc is not None else -1
+        if fd >= 0:
+            self.mode = 'inotify'
+            target = self._run_inotify
+            # Watch before returning, so no change made after start() is missed
+            args = (fd, self._add_watches(libc, fd))
+        else:
+            self.mode = 'polling'
+            target = self._run_polling
+            args = ()
+        self._thread = threading.Thread(target=target, args=args, name='file-watcher', daemon=True)
+        self._thread.start()
+        log.info('Watching files', extra={'mode': self.mode, 'files': sorted(self._callbacks)})
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _notify(self, paths):
+        for path in sorted(paths):
+            try:
+                self._callbacks[path](path)
+            except Exception:
+                log.exception('File change handler failed', extra={'path': path})
+
+    def _add_watches(self, libc, fd):
+        """Watch the directory of every file; returns {watch descriptor: directory}"""
+        directories = {}
+        for path in self._callbacks:
+            directory = os.path.dirname(path)
+            if directory in directories.values():
+                continue
+            wd = libc.inotify_add_watch(
+                fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_MODIFY
+            )
+            if wd < 0:
+                log.warning('Cannot watch directory', extra={'path': directory, 'errno': ctypes.get_errno()})
+                continue
+            directories[wd] = directory
+        return directories
+
+    def _run_inotify(self, fd, directories):
+        try:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([fd], [], [], 0.5)
+                if not ready:
+                    continue
+                changed = set()
+                # Collect the burst of events an editor or atomic write produces
+                while True:
+                    changed |= self._read_events(fd, directories)
+                    ready, _, _ = select.select([fd], [], [], DEBOUNCE)
+                    if not ready:
+                        break
+                if changed:
+                    self._notify(changed)
+        finally:
+            os.close(fd)
+
+    def _read_events(self, fd, directories):
+        try:
+            data = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, _, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+            offset += _EVENT.size + length
+            directory = directories.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if path in self._callbacks:
+                changed.add(path)
+        return changed
+
+    def _run_polling(self):
+        stamps = {path: _mtime(path) for path in self._callbacks}
+        while not self._stop.wait(self.poll_interval):
+            changed = set()
+            for path, stamp in stamps.items():
+                current = _mtime(path)
+                if current != stamp:
+                    stamps[path] = current
+                    changed.add(path)
+            if changed:
+                time.sleep(DEBOUNCE)
+                self._notify(changed)